@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import Counter, deque
+from app.core.engine import metrics
+from app.core.executor import inference_pool
+
+
+class MicroBatcher:
+    """
+    Dynamic request micro-batching in front of the inference engine.
+    Requests arriving within `max_wait_ms` of the first waiting request are
+    collected (up to `max_batch_size`), run as one `handler(items)` call on the
+    inference pool, and the results are fanned back out to each caller.
+    `handler` must return one result per item; an Exception result is raised
+    only for the caller that submitted that item.
+    """
+
+    def __init__(self, handler, max_batch_size: int = 32, max_wait_ms: float = 5.0, history: int = 1000):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._pending = []
+        self._wakeup = None
+        self._collector = None
+        self._dispatches = set()
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._size_counts = Counter()
+        self._run_ms = deque(maxlen=history)
+        self._wait_ms = deque(maxlen=history)
+
+    async def submit(self, item):
+        """Queues one item and waits for its result."""
+        loop = asyncio.get_running_loop()
+        if self._collector is None or self._collector.done() or self._collector.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._collector = loop.create_task(self._collect())
+
+        future = loop.create_future()
+        queued_at = time.perf_counter()
+        self._pending.append((item, future, queued_at))
+        self._wakeup.set()
+        try:
+            return await future
+        finally:
+            metrics.observe_stage("predict_batch", time.perf_counter() - queued_at)
+
+    async def _collect(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+
+            # Hold the window open until it is full or the oldest request hits max_wait
+            deadline = self._pending[0][2] + self.max_wait_ms / 1000
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            if self._pending:
+                self._wakeup.set()
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        # Shared work: don't charge it to whichever request started the collector
+        metrics.request_timings.set(None)
+        started = time.perf_counter()
+        try:
+            results = await inference_pool.run(self.handler, [item for item, _, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finished = time.perf_counter()
+
+        self._batches += 1
+        self._items += len(batch)
+        self._size_counts[len(batch)] += 1
+        self._run_ms.append((finished - started) * 1000)
+        for _, _, queued_at in batch:
+            self._wait_ms.append((started - queued_at) * 1000)
+            metrics.observe_wait("predict_batcher", started - queued_at)
+        metrics.observe_batch("predict", len(batch))
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def _percentiles(values) -> dict:
+        if not values:
+            return {"p50": None, "p95": None, "max": None}
+        ordered = sorted(values)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+        return {"p50": pick(0.50), "p95": pick(0.95), "max": round(ordered[-1], 2)}
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self._batches,
+            "requests": self._items,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else None,
+            "batch_size_histogram": dict(sorted(self._size_counts.items())),
+            "batch_latency_ms": self._percentiles(self._run_ms),
+            "queue_wait_ms": self._percentiles(self._wait_ms),
+        }
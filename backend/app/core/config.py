@@ -15,4 +15,104 @@ class Settings:
     # For demo purposes, we treat the image as covering a larger area to make numbers look realistic like the PDF (12.4 km2)
     AREA_SCALE_FACTOR: float = 0.05 
 
+    # Number of patches stacked into a single forward pass during map analysis
+    INFERENCE_BATCH_SIZE: int = 64
+
+    # Serving processes for `python -m app.main`: above 1, the model is loaded once
+    # and its weights shared with forked workers (see app/core/prefork.py)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    # Cores the server may use (0 = all); each worker gets CPU_BUDGET // SERVER_WORKERS
+    # torch intra-op threads, plus TORCH_INTEROP_THREADS inter-op threads
+    CPU_BUDGET: int = 0
+    TORCH_INTEROP_THREADS: int = 1
+
+    # Inference executor: "thread" shares one model, "process" preloads a model per worker
+    INFERENCE_EXECUTOR: str = "thread"
+    INFERENCE_WORKERS: int = 2
+    # Requests allowed to wait for a worker before the API answers 503
+    INFERENCE_MAX_QUEUE: int = 8
+
+    # /classification/predict micro-batching: requests arriving within the
+    # wait window are run together as one tensor batch
+    PREDICT_MAX_BATCH_SIZE: int = 32
+    PREDICT_MAX_WAIT_MS: float = 5.0
+
+    # Load the model and run a dummy forward pass at startup (see /health/ready)
+    WARMUP_ON_STARTUP: bool = True
+    WARMUP_BATCH_SIZE: int = 8
+
+    # Content-addressed prediction cache (per patch / per map tile)
+    PREDICTION_CACHE_ENABLED: bool = True
+    PREDICTION_CACHE_MAX_ENTRIES: int = 50000
+    # Optional on-disk tier, e.g. "cache/predictions" (None = memory only)
+    PREDICTION_CACHE_DIR = None
+
+    # /classification/augment-preview: variants (see services.AUGMENTATIONS), preview
+    # edge in pixels, encoding ("webp", "jpeg" or "png") and lossy quality
+    AUGMENT_SET: list = ["rotated", "flipped", "brightness"]
+    AUGMENT_PREVIEW_SIZE: int = 300
+    AUGMENT_FORMAT: str = "webp"
+    AUGMENT_QUALITY: int = 80
+    # Threads rendering variants concurrently, and encoded variants kept in memory
+    # by the serving process (delivery=url links only work with SERVER_WORKERS = 1)
+    AUGMENT_WORKERS: int = 4
+    AUGMENT_CACHE_ITEMS: int = 256
+
+    # Demo page snapshots (app/static/latest_*): write 1 prediction in N, 0 = off
+    DEMO_SNAPSHOT_EVERY_N: int = 0
+
+    # CPU inference backend: "eager", "torchscript", "int8_dynamic", "int8_static" or "onnx"
+    # (onnx needs onnxruntime). Checked against eager at load; falls back to eager
+    # when top-1 agreement on the validation set is below BACKEND_MIN_AGREEMENT
+    INFERENCE_BACKEND: str = "eager"
+    # Folder of sample patches for int8 calibration / validation (None = synthetic;
+    # int8_dynamic / int8_static then fall back to eager)
+    BACKEND_VALIDATION_DIR = None
+    BACKEND_VALIDATION_SAMPLES: int = 64
+    BACKEND_MIN_AGREEMENT: float = 0.98
+
+    # Early-exit cascade before ResNet50: None, "histogram" (.npz from
+    # ai_engine.fit_cascade) or "mobilenet" (.pth, isro_model layout).
+    # Patches it classifies with >= CASCADE_THRESHOLD confidence skip the big model
+    CASCADE_MODEL = None
+    CASCADE_MODEL_PATH = None
+    CASCADE_THRESHOLD: float = 0.9
+
+    # Zoom pyramids (/classification/pyramid): finest grid computed once per image,
+    # coarser levels aggregated. Kept for the last N images, optionally on disk too
+    # (required with SERVER_WORKERS > 1: workers serve each other's pyramids from it)
+    PYRAMID_MAX_IMAGES: int = 32
+    PYRAMID_DIR = None
+    # XYZ tile edge in grid cells
+    PYRAMID_TILE_CELLS: int = 16
+
+    # Background analysis jobs (/jobs): SQLite store for status and results
+    JOB_DB_PATH: str = "data/jobs.db"
+    # Jobs run at once, jobs allowed to wait (503 beyond), max queue wait and run time
+    JOB_WORKERS: int = 1
+    JOB_MAX_QUEUE: int = 32
+    JOB_MAX_WAIT_S: float = 600.0
+    JOB_TIMEOUT_S: float = 1800.0
+
+    # Fine-tuning over /training/ws/start: labelled patches in TRAINING_DATA_DIR/<class name>/,
+    # best checkpoint written in the isro_model.pth format (point MODEL_PATH at it to serve it)
+    TRAINING_DATA_DIR: str = "data/training"
+    TRAINING_OUTPUT_PATH: str = "data/models/isro_model_finetuned.pth"
+    # Decoded patches and frozen-backbone features, reused across epochs and runs
+    TRAINING_CACHE_DIR: str = "data/training_cache"
+    TRAINING_EPOCHS: int = 10
+    TRAINING_BATCH_SIZE: int = 32
+    TRAINING_LR: float = 1e-3
+    TRAINING_VAL_SPLIT: float = 0.2
+    TRAINING_LOADER_WORKERS: int = 2
+    # Train only the fc head on precomputed backbone features (fast on CPU)
+    TRAINING_FREEZE_BACKBONE: bool = True
+
+    # Per-stage timing histograms and counters, served at /metrics (Prometheus text format)
+    METRICS_ENABLED: bool = True
+    # Add a Server-Timing header (per-stage durations) to every response
+    SERVER_TIMING_ENABLED: bool = False
+
 settings = Settings()
\ No newline at end of file
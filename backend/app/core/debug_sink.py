@@ -0,0 +1,53 @@
+import os
+import json
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+
+
+class DemoSnapshotSink:
+    """
+    Sampled, asynchronous writer for the demo page snapshots
+    (app/static/latest_input.png + latest_result.json).
+    Off when `every_n` is 0; otherwise one prediction in `every_n` is written
+    by a single background thread, so the request path never waits on disk
+    and concurrent writes can't interleave. Files are replaced atomically.
+    """
+
+    def __init__(self, every_n: int = 0, static_dir: str = STATIC_DIR):
+        self.every_n = every_n
+        self.static_dir = static_dir
+        self._count = 0
+        self._lock = Lock()
+        self._writer = None
+
+    def capture(self, image_bytes: bytes, result: dict):
+        if not self.every_n:
+            return
+        with self._lock:
+            self._count += 1
+            if self._count % self.every_n:
+                return
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="demo-snapshot")
+        self._writer.submit(self._write, image_bytes, result)
+
+    def _write(self, image_bytes: bytes, result: dict):
+        try:
+            os.makedirs(self.static_dir, exist_ok=True)
+            self._replace("latest_input.png", "wb", image_bytes)
+            self._replace("latest_result.json", "w", json.dumps(result, indent=4))
+        except Exception as e:
+            print(f"Warning: Could not save demo snapshot: {e}")
+
+    def _replace(self, name: str, mode: str, data):
+        path = os.path.join(self.static_dir, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+demo_sink = DemoSnapshotSink(every_n=settings.DEMO_SNAPSHOT_EVERY_N)
@@ -0,0 +1,17 @@
+import os
+import sys
+
+# 'core' (the ISRO inference engine) is a sibling of 'app' inside backend/.
+# Resolve it once per process instead of on every request.
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../"))
+if BACKEND_ROOT not in sys.path:
+    sys.path.append(BACKEND_ROOT)
+
+# Stdlib-only, importable even when the engine's ML dependencies are missing
+from core import metrics
+
+try:
+    from core import ai_engine
+except ImportError as e:
+    print(f"CRITICAL: Could not import backend.core.ai_engine ({e}). Falling back to MOCK.")
+    ai_engine = None
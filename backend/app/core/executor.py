@@ -0,0 +1,150 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.engine import metrics
+
+_DONE = object()
+
+
+def _timed_call(submitted, fn):
+    """Runs fn() in a worker thread, recording how long it queued for a free worker."""
+    metrics.observe_wait("inference_pool", time.perf_counter() - submitted)
+    return fn()
+
+
+def _init_process_worker():
+    """Process pool initializer: every worker loads its own copy of the model once."""
+    try:
+        from app.core.engine import ai_engine
+        from app.features.classification.services import ClassificationService
+        ClassificationService.configure_engine()
+        ai_engine._load_model_if_needed()
+    except Exception as e:
+        print(f"Warning: inference worker could not preload the model: {e}")
+
+
+class InferencePool:
+    """
+    Executor layer for blocking inference work (PIL decode, PyTorch forward).
+    Keeps the event loop free and bounds how much work can be in flight:
+    `workers` jobs run at once, up to `max_queue` more may wait, and anything
+    beyond that is rejected with 503 so clients back off instead of piling up.
+    """
+
+    def __init__(self, kind: str = "thread", workers: int = 2, max_queue: int = 8):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._stream_executor = None
+        self._in_flight = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_process_worker
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="inference"
+                )
+        return self._executor
+
+    def _get_stream_executor(self):
+        # Generators can't cross process boundaries, so streams always step in threads
+        if self.kind == "thread":
+            return self._get_executor()
+        if self._stream_executor is None:
+            self._stream_executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="inference-stream"
+            )
+        return self._stream_executor
+
+    def _reserve(self):
+        if self._in_flight >= self.capacity:
+            raise HTTPException(
+                status_code=503,
+                detail="Inference queue is full, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self._in_flight += 1
+
+    def _release(self):
+        self._in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) on the pool and awaits the result (503 when saturated)."""
+        self._reserve()
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(fn, *args, **kwargs)
+            if self.kind == "thread":
+                # Carry the request context (Server-Timing) into the worker thread
+                ctx = contextvars.copy_context()
+                call = functools.partial(ctx.run, _timed_call, time.perf_counter(), call)
+            return await loop.run_in_executor(self._get_executor(), call)
+        finally:
+            self._release()
+
+    def stream(self, fn, *args, **kwargs):
+        """
+        Async iterator that advances the blocking generator fn(*args, **kwargs)
+        on the pool. The slot is reserved on the first step (503 when
+        saturated) and released once the iterator is exhausted or closed, so
+        a response whose body is never iterated holds no slot.
+        """
+        return self._drain(fn, args, kwargs)
+
+    async def _drain(self, fn, args, kwargs):
+        self._reserve()
+        iterator = None
+        loop = asyncio.get_running_loop()
+        try:
+            iterator = fn(*args, **kwargs)
+            while True:
+                item = await loop.run_in_executor(self._get_stream_executor(), next, iterator, _DONE)
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            if iterator is not None:
+                try:
+                    iterator.close()
+                except ValueError:
+                    # Still running a step in a worker (client went away mid-batch)
+                    pass
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": max(0, self._in_flight - self.workers),
+        }
+
+    def shutdown(self):
+        for executor in (self._executor, self._stream_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._stream_executor = None
+
+
+inference_pool = InferencePool(
+    kind=settings.INFERENCE_EXECUTOR,
+    workers=settings.INFERENCE_WORKERS,
+    max_queue=settings.INFERENCE_MAX_QUEUE,
+)
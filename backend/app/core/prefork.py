@@ -0,0 +1,174 @@
+import os
+import resource
+import signal
+import socket
+import time
+from app.core.config import settings
+from app.core.engine import ai_engine
+
+
+def thread_layout(workers: int = None, budget: int = None, interop: int = None) -> dict:
+    """
+    Torch threads per serving process from the core budget in Settings:
+    every worker gets an equal share of CPU_BUDGET (0 = all cores) as
+    intra-op threads, so workers x threads never exceeds the budget.
+    """
+    workers = max(1, workers or settings.SERVER_WORKERS)
+    budget = budget or settings.CPU_BUDGET or os.cpu_count() or 1
+    return {
+        "workers": workers,
+        "cpu_budget": budget,
+        "intra_op_threads": max(1, budget // workers),
+        "interop_threads": max(1, interop or settings.TORCH_INTEROP_THREADS),
+    }
+
+
+def apply_thread_layout(layout: dict):
+    """Sets this process's torch thread pools. Called from the app lifespan."""
+    import torch
+    torch.set_num_threads(layout["intra_op_threads"])
+    try:
+        torch.set_num_interop_threads(layout["interop_threads"])
+    except RuntimeError:
+        # Only settable before the first inter-op task; keep whatever is running
+        pass
+    layout["interop_threads"] = torch.get_num_interop_threads()
+
+
+def memory_report(pid="self") -> dict:
+    """
+    Resident memory of a process in MB. On Linux `shared` counts pages also
+    mapped by other processes (e.g. model weights inherited from the prefork
+    parent) and `pss` splits those evenly, so summing pss over all workers
+    gives their real combined footprint.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        # No /proc: peak RSS of this process only
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss_mb": round(peak / 1024, 1), "pss_mb": None, "shared_mb": None, "private_mb": None}
+    return {
+        "rss_mb": round(fields.get("Rss", 0), 1),
+        "pss_mb": round(fields.get("Pss", 0), 1),
+        "shared_mb": round(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0), 1),
+        "private_mb": round(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0), 1),
+    }
+
+
+def worker_report(layout: dict) -> str:
+    memory = memory_report()
+    line = (f"👷 Worker {os.getpid()}: {layout['intra_op_threads']} intra-op / "
+            f"{layout['interop_threads']} inter-op threads, RSS {memory['rss_mb']} MB")
+    if memory["pss_mb"] is not None:
+        line += f" (shared {memory['shared_mb']} MB, private {memory['private_mb']} MB, PSS {memory['pss_mb']} MB)"
+    return line
+
+
+def _preload_model():
+    """
+    Loads the model in the prefork parent with a single torch thread (no
+    OpenMP team exists yet when the workers fork) and moves its weights to
+    shared memory. Returns the shared size in MB, None when not preloaded.
+    """
+    from app.features.classification.services import ClassificationService
+    import torch
+
+    if ai_engine is None:
+        return None
+    if settings.INFERENCE_BACKEND == "onnx":
+        # onnxruntime sessions own thread pools that do not survive fork
+        print("⚠️ Warning: onnx backend is loaded per worker, weights are not shared.")
+        return None
+
+    torch.set_num_threads(1)
+    ClassificationService.configure_engine()
+    try:
+        ai_engine._load_model_if_needed()
+    except Exception as e:
+        print(f"⚠️ Warning: Could not preload the model, workers load their own: {e}")
+        return None
+    return round(ai_engine.share_model_memory() / 2**20, 1)
+
+
+def _run_worker(app, sock):
+    import uvicorn
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, workers=1, log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(app, host: str = None, port: int = None, workers: int = None):
+    """
+    Prefork server: loads the model once, binds the listening socket, then
+    forks `workers` uvicorn processes that inherit both. Weights stay one
+    shared copy; each worker sets its own thread layout in the app lifespan.
+    Crashed workers are replaced until SIGINT / SIGTERM.
+    """
+    host = host or settings.SERVER_HOST
+    port = port or settings.SERVER_PORT
+    layout = thread_layout(workers)
+    if layout["workers"] > 1 and not settings.PYRAMID_DIR:
+        # Any worker may get the tile requests for a pyramid another one stored
+        raise RuntimeError("SERVER_WORKERS > 1 needs a shared PYRAMID_DIR for /classification/pyramid")
+
+    shared_mb = _preload_model()
+    print(f"🧵 {layout['workers']} workers x {layout['intra_op_threads']} intra-op threads "
+          f"(budget {layout['cpu_budget']} cores), {layout['interop_threads']} inter-op")
+    parent = memory_report()
+    print(f"📦 Parent {os.getpid()}: RSS {parent['rss_mb']} MB"
+          + (f", {shared_mb} MB of weights shared with workers" if shared_mb else ", weights not shared"))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"🚀 Serving on http://{host}:{port}")
+    for _ in range(layout["workers"]):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"⚠️ Warning: Worker {pid} exited ({os.waitstatus_to_exitcode(status)}), restarting.")
+            # Avoid a tight loop when workers die at startup
+            time.sleep(1)
+            spawn()
+    sock.close()
@@ -0,0 +1,37 @@
+import time
+from app.core.engine import metrics
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware adding a Server-Timing header with the time each
+    pipeline stage took for this request (decode, heuristics, forward, ...).
+    Stage timings reach it through metrics.request_timings, which the
+    inference pool carries into its worker threads.
+    Streaming responses only report the stages finished before the first byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {}
+        token = metrics.request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                timings["total"] = time.perf_counter() - started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing(timings).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.request_timings.reset(token)
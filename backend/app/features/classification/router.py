@@ -1,16 +1,47 @@
-from typing import List
-from fastapi import APIRouter, UploadFile, File
+import asyncio
+import json
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from app.core.batching import MicroBatcher
+from app.core.config import settings
+from app.core.executor import inference_pool
 from .services import ClassificationService
 
 router = APIRouter(prefix="/classification", tags=["Classification"])
 
+# Concurrent /predict calls are grouped into one tensor batch
+predict_batcher = MicroBatcher(
+    ClassificationService.predict_images,
+    max_batch_size=settings.PREDICT_MAX_BATCH_SIZE,
+    max_wait_ms=settings.PREDICT_MAX_WAIT_MS,
+)
+
+async def _upload_source(file: UploadFile):
+    """
+    Scenes are decoded straight from the spooled upload file (no extra copy).
+    Process workers can't receive file objects, so they get the bytes.
+    """
+    if inference_pool.kind == "process":
+        return await file.read()
+    return file.file
+
+async def _prepend(first, stream):
+    yield first
+    async for item in stream:
+        yield item
+
 @router.post("/predict")
 async def predict_single(file: UploadFile = File(...)):
     """Single image prediction endpoint"""
     contents = await file.read()
     
-    # 1. Preprocess & Predict (Service handles it now)
-    result = ClassificationService.call_teammate_model(contents)
+    # 1. Preprocess & Predict (micro-batched with other in-flight requests)
+    try:
+        result = await predict_batcher.submit(contents)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return {
         "filename": file.filename,
@@ -22,20 +53,17 @@ async def predict_single(file: UploadFile = File(...)):
 @router.post("/predict-batch")
 async def predict_batch(files: List[UploadFile] = File(...)):
     """Batch image prediction endpoint (Upload multiple patches)"""
-    predictions = []
-    
-    for file in files:
-        contents = await file.read()
-        # Service handles bytes directly
-        result = ClassificationService.call_teammate_model(contents)
-        predictions.append(result)
-        
-    # Aggregate stats
-    batch_stats = ClassificationService.process_batch(predictions)
+    contents = await asyncio.gather(*(file.read() for file in files))
+
+    # Decode, tensor-batched inference and aggregation run on the inference pool
+    batch = await inference_pool.run(
+        ClassificationService.predict_batch, list(contents), [file.filename for file in files]
+    )
     
     return {
         "message": "Batch processed successfully",
-        "stats": batch_stats
+        "stats": batch["stats"],
+        "results": batch["results"]
     }
 
 @router.post("/change-detection")
@@ -49,38 +77,246 @@ async def change_detection(
     img1 = await file1.read()
     img2 = await file2.read()
     
-    change_report = ClassificationService.calculate_change_detection(img1, img2)
+    change_report = await inference_pool.run(ClassificationService.calculate_change_detection, img1, img2)
     
     return {
         "message": "Change detection complete",
         "report": change_report
     }
     
+@router.post("/change-detection/grid")
+async def change_detection_grid(
+    file1: UploadFile = File(...),
+    file2: UploadFile = File(...),
+    patch_size: int = 64
+):
+    """
+    Full-scene change detection: classifies both years on the patch grid and
+    returns the class transition matrix, per-class areas and a change mask.
+    """
+    source1 = await _upload_source(file1)
+    source2 = await _upload_source(file2)
+    try:
+        report = await inference_pool.run(
+            ClassificationService.calculate_grid_change_detection, source1, source2, patch_size
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {
+        "message": "Change detection complete",
+        "report": report
+    }
+
 @router.post("/augment-preview")
-async def augment_preview(file: UploadFile = File(...)):
+async def augment_preview(
+    file: UploadFile = File(...),
+    augmentations: Optional[str] = None,
+    delivery: str = "inline"
+):
     """
-    Returns 3 augmented versions of the uploaded image (Rotated, Flipped, Brightness).
+    Returns augmented versions of the uploaded image (default: Rotated, Flipped, Brightness).
+    augmentations: comma-separated variant names (see services.AUGMENTATIONS).
+    delivery: inline (base64 in the JSON body) or url (links to
+    /augment-preview/{image_id}/{name}, fetched as binary images).
+    Images are AUGMENT_FORMAT encoded, see media_type in the response.
     """
+    if delivery not in ("inline", "url"):
+        raise HTTPException(status_code=422, detail=f"Unknown delivery: {delivery}")
+    if delivery == "url" and settings.SERVER_WORKERS > 1:
+        # Links are served from this process's preview cache; another worker may get the GET
+        raise HTTPException(status_code=422, detail="delivery=url needs SERVER_WORKERS = 1, use delivery=inline")
+    names = [name.strip() for name in augmentations.split(",") if name.strip()] if augmentations else None
+
     contents = await file.read()
-    augments = ClassificationService.generate_augmentations(contents)
+    try:
+        image_id, encoded = ClassificationService.cached_augmentations(contents, names)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    missing = [name for name, body in encoded.items() if body is None]
+    rendered = {}
+    if missing:
+        rendered = await inference_pool.run(ClassificationService.render_augmentations, contents, missing)
     return {
         "message": "Augmentation preview generated",
-        "images": augments
+        **ClassificationService.store_augmentations(image_id, encoded, rendered, delivery)
     }
 
+@router.get("/augment-preview/{image_id}/{name}")
+async def augment_preview_image(image_id: str, name: str):
+    """One encoded preview variant (delivery=url). Content-addressed, so cacheable by the browser."""
+    try:
+        preview = ClassificationService.get_augmentation(image_id, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Preview expired, POST the image to /classification/augment-preview")
+    return Response(
+        content=preview["body"],
+        media_type=preview["media_type"],
+        headers={"Cache-Control": "public, max-age=86400, immutable"}
+    )
+
+# Accept header -> analyze-map format when no ?format= is given
+_GRID_FORMATS_BY_ACCEPT = {
+    "application/vnd.vega.grid+json": "compact",
+    "application/octet-stream": "binary",
+    "image/png": "png",
+}
+
 @router.post("/analyze-map")
 async def analyze_map(
+    request: Request,
     file: UploadFile = File(...),
-    patch_size: int = 64
+    patch_size: int = 64,
+    format: Optional[str] = None,
+    confidence_dtype: str = "float16",
+    stride: Optional[int] = None
 ):
     """
     Full satellite image grid analysis.
     Returns the same JSON as test_run.py:
     { filename, image_width, image_height, patch_size, grid: [{x, y, class, confidence}] }
+
+    Compact encodings (?format= or Accept header):
+      compact (application/vnd.vega.grid+json) - JSON with base64 uint8 labels + confidences
+      binary  (application/octet-stream)       - raw labels then confidences, metadata in X- headers
+      png     (image/png)                      - palette label map, one pixel per grid cell
+    confidence_dtype: float16 (percent) or uint8 (rounded percent)
+
+    stride: sliding-window step in pixels (patch_size must be a multiple of it).
+    Windows overlap, each cell's scores are averaged over every window covering
+    it, and the grid is reported at stride resolution (x/y step = stride).
     """
-    contents = await file.read()
-    result = ClassificationService.analyze_map(contents, file.filename, patch_size)
-    return result
+    if format is None:
+        accept = request.headers.get("accept", "")
+        format = next((fmt for mime, fmt in _GRID_FORMATS_BY_ACCEPT.items() if mime in accept), "json")
+    if format not in ("json", "compact", "binary", "png"):
+        raise HTTPException(status_code=422, detail=f"Unknown format: {format}")
+    if confidence_dtype not in ("float16", "uint8"):
+        raise HTTPException(status_code=422, detail=f"Unknown confidence_dtype: {confidence_dtype}")
+    if stride is not None and (stride <= 0 or patch_size % stride):
+        raise HTTPException(status_code=422, detail="stride must be a positive divisor of patch_size")
+
+    source = await _upload_source(file)
+    if format == "json":
+        return await inference_pool.run(ClassificationService.analyze_map, source, file.filename, patch_size, stride)
+
+    encoded = await inference_pool.run(
+        ClassificationService.analyze_map_compact, source, file.filename, patch_size, format, confidence_dtype, stride
+    )
+    if format == "compact":
+        return encoded["body"]
+    return Response(content=encoded["body"], media_type=encoded["media_type"], headers=encoded["headers"])
+
+@router.post("/analyze-map/stream")
+async def analyze_map_stream(
+    file: UploadFile = File(...),
+    patch_size: int = 64
+):
+    """
+    Streaming full satellite image grid analysis (NDJSON, one JSON object per line).
+    Frames: {"type": "meta"}, then {"type": "cells", "cells": [{x, y, class, confidence}]}
+    and {"type": "progress"} after every inference batch, and a final {"type": "complete"}.
+    """
+    source = await _upload_source(file)
+    stream = inference_pool.stream(ClassificationService.stream_map_analysis, source, file.filename, patch_size)
+    # First frame before the headers: a full pool still answers 503, an undecodable upload 400
+    first = await anext(stream)
+    frame = json.loads(first)
+    if frame["type"] == "error":
+        await stream.aclose()
+        raise HTTPException(status_code=400, detail=frame["detail"])
+    return StreamingResponse(
+        _prepend(first, stream),
+        media_type="application/x-ndjson",
+        # Returns the pool slot even if the client leaves before the body is read
+        background=BackgroundTask(stream.aclose)
+    )
+
+@router.post("/pyramid")
+async def create_pyramid(
+    file: UploadFile = File(...),
+    patch_size: int = 64
+):
+    """
+    Zoom pyramid analysis: classifies the finest grid (patch_size cells) once
+    and aggregates coarser levels (majority class, mean confidence per 2x2).
+    Returns the image_id and levels; tiles are then served from
+    /pyramid/{image_id}/{z}/{x}/{y} without running inference again.
+    Uploading the same image again returns the stored pyramid.
+    """
+    data = await file.read()
+    image_id, pyramid, cached = await inference_pool.run(ClassificationService.build_pyramid, data, patch_size)
+    # Stored here, not in the pool: process workers have their own pyramid_store
+    return ClassificationService.store_pyramid(image_id, pyramid, cached, file.filename)
+
+@router.get("/pyramid/{image_id}")
+async def pyramid_info(image_id: str):
+    """Levels (zoom, cell size, grid and tile counts) of a stored pyramid."""
+    try:
+        return ClassificationService.get_pyramid_info(image_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown pyramid, POST the image to /classification/pyramid")
+
+@router.get("/pyramid/{image_id}/window")
+async def pyramid_window(image_id: str, z: int, x0: int, y0: int, x1: int, y1: int):
+    """
+    Cells of zoom level z overlapping a viewport in image pixels, in the
+    analyze-map shape { grid: [{x, y, class, confidence}] }.
+    """
+    try:
+        return ClassificationService.get_pyramid_window(image_id, z, x0, y0, x1, y1)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown pyramid, POST the image to /classification/pyramid")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/pyramid/{image_id}/{z}/{x}/{y}")
+async def pyramid_tile(image_id: str, z: int, x: int, y: int, format: str = "json"):
+    """
+    XYZ tile (tile_size x tile_size cells of zoom z) from a stored pyramid.
+    format: json (analyze-map style cells) or png (palette label image, one pixel per cell).
+    """
+    if format not in ("json", "png"):
+        raise HTTPException(status_code=422, detail=f"Unknown format: {format}")
+    try:
+        tile = ClassificationService.get_pyramid_tile(image_id, z, x, y, format)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown pyramid, POST the image to /classification/pyramid")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if format == "png":
+        return Response(content=tile["body"], media_type=tile["media_type"])
+    return tile["body"]
+
+@router.get("/pool-status")
+async def pool_status():
+    """
+    Current load of the inference worker pool (in-flight and queued requests).
+    """
+    return inference_pool.stats()
+
+@router.get("/batching-stats")
+async def batching_stats():
+    """
+    Micro-batching metrics for /predict (batch sizes, batch latency, queue wait).
+    """
+    return predict_batcher.stats()
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """
+    Prediction cache counters (entries, hits, disk hits, misses, evictions).
+    """
+    return ClassificationService.get_cache_stats()
+
+@router.get("/cascade-stats")
+async def cascade_stats():
+    """
+    Early-exit statistics: how many patches the heuristics, cache, cascade
+    and ResNet50 each answered, and each layer's acceptance rate.
+    """
+    return ClassificationService.get_cascade_stats()
 
 @router.get("/leaderboard")
 async def get_leaderboard():
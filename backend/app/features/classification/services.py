@@ -1,18 +1,47 @@
 import io
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 import numpy as np
 from PIL import Image
 from app.core.config import settings
+from app.core.debug_sink import demo_sink
+from app.core.engine import ai_engine, metrics
+from core.pyramid import PyramidStore
+from core.raster import open_image
 from PIL import Image, ImageEnhance
 import os
+import json
 import base64
 
+# Zoom pyramids by image id, see build_pyramid()
+pyramid_store = PyramidStore(settings.PYRAMID_MAX_IMAGES, settings.PYRAMID_DIR)
+
+# Augment-preview variants by name (AUGMENT_SET picks the default ones)
+AUGMENTATIONS = {
+    "rotated": lambda img: img.transpose(Image.ROTATE_90),
+    "rotated_180": lambda img: img.transpose(Image.ROTATE_180),
+    "flipped": lambda img: img.transpose(Image.FLIP_LEFT_RIGHT),
+    "flipped_vertical": lambda img: img.transpose(Image.FLIP_TOP_BOTTOM),
+    "brightness": lambda img: ImageEnhance.Brightness(img).enhance(1.5),
+    "contrast": lambda img: ImageEnhance.Contrast(img).enhance(1.5),
+    "grayscale": lambda img: img.convert("L").convert("RGB"),
+}
+_PREVIEW_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+
+# Encoded previews by (image_id, variant), LRU over AUGMENT_CACHE_ITEMS variants
+_preview_cache = OrderedDict()
+_preview_lock = Lock()
+_augment_pool = None
+
 class ClassificationService:
     @staticmethod
     def preprocess_image(image_bytes: bytes) -> np.ndarray:
         """
         Prepares the image for the ML model (Resize 224x224, Normalize).
         """
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        img = open_image(io.BytesIO(image_bytes)).convert('RGB')
         img_resized = img.resize((settings.IMAGE_SIZE, settings.IMAGE_SIZE))
         img_array = np.array(img_resized).astype(np.float32) / 255.0
         
@@ -26,58 +55,87 @@ class ClassificationService:
         ### TEAMMATE INTEGRATION POINT ###
         Calls the actual ISRO model from backend/core/ai_engine.py
         """
-        # 1. Save Input for Demo
-        try:
-            static_dir = os.path.join(os.getcwd(), "app/static")
-            os.makedirs(static_dir, exist_ok=True)
-            
-            with open(os.path.join(static_dir, "latest_input.png"), "wb") as f:
-                f.write(image_bytes)
-        except Exception as e:
-            print(f"Warning: Could not save demo input: {e}")
+        if ai_engine is None:
+            # Fallback Mock (engine could not be imported, see app/core/engine.py)
+            return ClassificationService._mock_prediction()
 
-        # 2. Call Real Model
-        # We need to import the core engine. 
-        # Since uvicorn runs from 'backend/', 'app' is a package, and 'core' is a sibling folder.
-        # We try to import it dynamically or assume python path is set root-wise.
-        try:
-            import sys
-            # Ensure backend root is in path
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            backend_root = os.path.abspath(os.path.join(current_dir, "../../../"))
-            if backend_root not in sys.path:
-                sys.path.append(backend_root)
-                
-            from core import ai_engine
-            
-            # Predict
-            result = ai_engine.predict_patch(image_bytes)
-            
-            # 3. Save Output for Demo
-            try:
-                import json
-                with open(os.path.join(static_dir, "latest_result.json"), "w") as f:
-                    json.dump(result, f, indent=4)
-            except Exception as e:
-                print(f"Warning: Could not save demo output: {e}")
-                
-            return {
+        # 1. Call Real Model
+        result = ai_engine.predict_patch(image_bytes)
+
+        # 2. Sampled, async snapshot for the demo page (off by default)
+        demo_sink.capture(image_bytes, result)
+
+        return {
+            "label": result["class"],
+            "confidence": result["confidence"],
+            "probabilities": result["probabilities"]
+        }
+    
+    @staticmethod
+    def predict_images(images: list, batch_size: int = None) -> list:
+        """
+        Batched counterpart of call_teammate_model, used by the /predict
+        micro-batcher. Returns one {label, confidence, probabilities} dict per
+        image, or a ValueError for images that could not be decoded.
+        """
+        if ai_engine is None:
+            # Fallback Mock, same as call_teammate_model
+            return [ClassificationService._mock_prediction() for _ in images]
+
+        engine_results = ai_engine.predict_patches(images, batch_size or settings.PREDICT_MAX_BATCH_SIZE)
+
+        results = []
+        for result in engine_results:
+            if "error" in result:
+                results.append(ValueError(result["error"]))
+                continue
+            results.append({
                 "label": result["class"],
                 "confidence": result["confidence"],
                 "probabilities": result["probabilities"]
-            }
-            
-        except ImportError:
-            print("CRITICAL: Could not import backend.core.ai_engine. Falling back to MOCK.")
-            # Fallback Mock (Copy of original)
-            probs = np.random.dirichlet(np.ones(5), size=1)[0]
-            class_idx = np.argmax(probs)
-            return {
-                "label": settings.CLASSES[class_idx],
-                "confidence": round(float(probs[class_idx]) * 100, 2),
-                "probabilities": {settings.CLASSES[i]: round(float(probs[i]) * 100, 2) for i in range(5)}
-            }
-    
+            })
+
+        if engine_results and "error" not in engine_results[-1]:
+            demo_sink.capture(images[-1], engine_results[-1])
+        return results
+
+    @staticmethod
+    def _mock_prediction() -> dict:
+        """Random prediction served when core.ai_engine could not be imported."""
+        probs = np.random.dirichlet(np.ones(5), size=1)[0]
+        class_idx = np.argmax(probs)
+        return {
+            "label": settings.CLASSES[class_idx],
+            "confidence": round(float(probs[class_idx]) * 100, 2),
+            "probabilities": {settings.CLASSES[i]: round(float(probs[i]) * 100, 2) for i in range(5)}
+        }
+
+    @staticmethod
+    def predict_batch(images: list, filenames: list) -> dict:
+        """
+        Batch pipeline for POST /classification/predict-batch: uploads are decoded
+        concurrently and classified in tensor batches, then aggregated.
+        """
+        predictions = ClassificationService.predict_images(images, settings.INFERENCE_BATCH_SIZE)
+
+        results = []
+        for filename, pred in zip(filenames, predictions):
+            if isinstance(pred, Exception):
+                results.append({"filename": filename, "error": str(pred)})
+                continue
+            results.append({
+                "filename": filename,
+                "prediction": pred["label"],
+                "confidence": pred["confidence"],
+                "breakdown": pred["probabilities"]
+            })
+
+        stats = ClassificationService.process_batch(
+            [pred for pred in predictions if not isinstance(pred, Exception)]
+        )
+        stats["failed"] = len(predictions) - stats["total_processed"]
+        return {"stats": stats, "results": results}
+
     @staticmethod
     def process_batch(predictions: list) -> dict:
         """
@@ -118,22 +176,7 @@ class ClassificationService:
             area_year1 = round((pct_year1 / 100) * settings.AREA_SCALE_FACTOR * (settings.IMAGE_SIZE ** 2), 2)
             area_year2 = round((pct_year2 / 100) * settings.AREA_SCALE_FACTOR * (settings.IMAGE_SIZE ** 2), 2)
             
-            # Calculate % Change (PDF Page 7)
-            diff = area_year2 - area_year1
-            pct_change = 0.0
-            if area_year1 > 0:
-                pct_change = round(((area_year2 - area_year1) / area_year1) * 100, 1)
-            
-            direction = "↑" if diff > 0 else "↓"
-            trend_type = "increasing" if diff > 0 else "decreasing"
-            
-            stats.append({
-                "class": cls,
-                "year1_area_km2": area_year1,
-                "year2_area_km2": area_year2,
-                "change_pct": f"{direction} {abs(pct_change)}%",
-                "trend": trend_type
-            })
+            stats.append(ClassificationService._area_change_row(cls, area_year1, area_year2))
 
         return {
             "year1_prediction": result1["label"],
@@ -142,75 +185,537 @@ class ClassificationService:
         }
         
     @staticmethod
-    def generate_augmentations(image_bytes: bytes) -> dict:
+    def _area_change_row(cls: str, area_year1: float, area_year2: float) -> dict:
+        """One area_stats row: areas plus % change and trend (PDF Page 7)."""
+        diff = area_year2 - area_year1
+        pct_change = 0.0
+        if area_year1 > 0:
+            pct_change = round(((area_year2 - area_year1) / area_year1) * 100, 1)
+        
+        direction = "↑" if diff > 0 else "↓"
+        trend_type = "increasing" if diff > 0 else "decreasing"
+        
+        return {
+            "class": cls,
+            "year1_area_km2": area_year1,
+            "year2_area_km2": area_year2,
+            "change_pct": f"{direction} {abs(pct_change)}%",
+            "trend": trend_type
+        }
+
+    @staticmethod
+    def calculate_grid_change_detection(source1, source2, patch_size: int = 64) -> dict:
         """
-        Generates 3 augmented versions for preview. 
-        Downscales to 300x300 to ensure fast Base64 transmission.
+        Full-scene change detection on the patch grid: both years are classified
+        cell by cell and compared. Returns per-class areas, the class A → class B
+        transition matrix (patch counts and km²), and a bit-packed change mask.
         """
-        try:
-            original = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            # Downscale for preview performance
-            original.thumbnail((300, 300)) 
+        result = ai_engine.compare_scenes(source1, source2, patch_size, settings.INFERENCE_BATCH_SIZE)
+        labels = result["labels"]
+        year1, year2 = result["year1_labels"], result["year2_labels"]
+        rows, cols = year1.shape
+        width, height = result["image_width"], result["image_height"]
+
+        # Pixel area of every grid cell (right/bottom edge cells are partial)
+        cell_w = np.minimum(patch_size, width - np.arange(cols) * patch_size)
+        cell_h = np.minimum(patch_size, height - np.arange(rows) * patch_size)
+        cell_pixels = np.outer(cell_h, cell_w)
 
-            results = {}
+        k = len(labels)
+        pairs = (year1.astype(np.int64) * k + year2).ravel()
+        counts = np.bincount(pairs, minlength=k * k).reshape(k, k)
+        areas = np.bincount(pairs, weights=cell_pixels.ravel(), minlength=k * k).reshape(k, k) \
+            * settings.AREA_SCALE_FACTOR
 
-            # 1. Rotation
-            rotated = original.rotate(90, expand=True)
-            results['rotated'] = ClassificationService._img_to_base64(rotated)
+        area_stats = [
+            ClassificationService._area_change_row(
+                cls, round(float(areas[i].sum()), 2), round(float(areas[:, i].sum()), 2)
+            )
+            for i, cls in enumerate(labels)
+        ]
+
+        transitions = [
+            {
+                "from": labels[i],
+                "to": labels[j],
+                "patches": int(counts[i, j]),
+                "area_km2": round(float(areas[i, j]), 2)
+            }
+            for i, j in zip(*np.nonzero(counts))
+            if i != j
+        ]
+        transitions.sort(key=lambda t: t["area_km2"], reverse=True)
+
+        changed = year1 != year2
+        changed_patches = int(changed.sum())
+
+        return {
+            "image_width": width,
+            "image_height": height,
+            "patch_size": patch_size,
+            "rows": rows,
+            "cols": cols,
+            "classes": labels,
+            "changed_patches": changed_patches,
+            "changed_pct": round(changed_patches / changed.size * 100, 2) if changed.size else 0.0,
+            "reused_patches": result["reused_patches"],
+            "area_stats": area_stats,
+            "transition_matrix": counts.tolist(),
+            "transitions": transitions,
+            "change_mask": {
+                # Row-major, 1 bit per grid cell (1 = class changed), MSB first
+                "encoding": "packbits-base64",
+                "rows": rows,
+                "cols": cols,
+                "data": base64.b64encode(np.packbits(changed.ravel()).tobytes()).decode('utf-8')
+            }
+        }
+
+    @staticmethod
+    def cached_augmentations(image_bytes: bytes, names: list = None) -> tuple:
+        """
+        First step of POST /classification/augment-preview, in the serving
+        process: the upload's image id and its variants (AUGMENTATIONS,
+        default AUGMENT_SET) from the preview cache, None where missing.
+        The id hashes the upload and preview settings, so repeated previews
+        skip decoding and encoding. Raises ValueError for unknown variant names.
+        """
+        names = list(names or settings.AUGMENT_SET)
+        unknown = [name for name in names if name not in AUGMENTATIONS]
+        if unknown:
+            raise ValueError(f"Unknown augmentation: {', '.join(unknown)} (expected one of {', '.join(AUGMENTATIONS)})")
 
-            # 2. Horizontal Flip
-            flipped = original.transpose(Image.FLIP_LEFT_RIGHT)
-            results['flipped'] = ClassificationService._img_to_base64(flipped)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{settings.AUGMENT_PREVIEW_SIZE}:{settings.AUGMENT_FORMAT}:{settings.AUGMENT_QUALITY}".encode())
+        digest.update(image_bytes)
+        image_id = digest.hexdigest()
+        return image_id, {name: ClassificationService._cached_preview(image_id, name) for name in names}
 
-            # 3. Brightness
-            enhancer = ImageEnhance.Brightness(original)
-            bright = enhancer.enhance(1.5)
-            results['brightness'] = ClassificationService._img_to_base64(bright)
+    @staticmethod
+    def render_augmentations(image_bytes: bytes, names: list) -> dict:
+        """
+        Variants of an upload downscaled to AUGMENT_PREVIEW_SIZE and encoded
+        as AUGMENT_FORMAT, transformed + encoded concurrently. Runs on the
+        inference pool and returns the bodies by name (None if the upload
+        could not be decoded); store_augmentations() caches them.
+        """
+        fmt = settings.AUGMENT_FORMAT
+        try:
+            with metrics.stage("decode"):
+                original = open_image(io.BytesIO(image_bytes))
+                # JPEG: decode at reduced scale, close to the preview size
+                original.draft("RGB", (settings.AUGMENT_PREVIEW_SIZE, settings.AUGMENT_PREVIEW_SIZE))
+                original = original.convert('RGB')
+                # Downscale for preview performance
+                original.thumbnail((settings.AUGMENT_PREVIEW_SIZE, settings.AUGMENT_PREVIEW_SIZE))
 
-            return results
+            with metrics.stage("augment"):
+                pool = ClassificationService._get_augment_pool()
+                futures = {
+                    name: pool.submit(ClassificationService._render_preview, original, name, fmt)
+                    for name in names
+                }
+                return {name: future.result() for name, future in futures.items()}
         except Exception as e:
             print(f"Augmentation Error: {e}")
-            return {}
+            return None
+
+    @staticmethod
+    def store_augmentations(image_id: str, encoded: dict, rendered: dict, delivery: str = "inline") -> dict:
+        """
+        Last step, in the serving process: caches the rendered variants (the
+        pool may be other processes, whose caches GET /augment-preview never
+        sees) and answers with base64 images ("inline") or
+        /classification/augment-preview/{image_id}/{name} links ("url").
+        """
+        fmt = settings.AUGMENT_FORMAT
+        if rendered is None:
+            return {"image_id": None, "format": fmt, "media_type": _PREVIEW_MEDIA_TYPES[fmt], "images": {}}
+        for name, body in rendered.items():
+            ClassificationService._store_preview(image_id, name, body)
+        encoded = {**encoded, **rendered}
+
+        if delivery == "url":
+            images = {name: f"/classification/augment-preview/{image_id}/{name}" for name in encoded}
+        else:
+            images = {name: base64.b64encode(body).decode('utf-8') for name, body in encoded.items()}
+        return {
+            "image_id": image_id,
+            "format": fmt,
+            "media_type": _PREVIEW_MEDIA_TYPES[fmt],
+            "cached": not rendered,
+            "images": images
+        }
+
+    @staticmethod
+    def get_augmentation(image_id: str, name: str) -> dict:
+        """Encoded preview from the cache for GET /augment-preview/{image_id}/{name}. KeyError once evicted."""
+        body = ClassificationService._cached_preview(image_id, name)
+        if body is None:
+            raise KeyError(image_id)
+        return {"media_type": _PREVIEW_MEDIA_TYPES[settings.AUGMENT_FORMAT], "body": body}
+
+    @staticmethod
+    def _get_augment_pool() -> ThreadPoolExecutor:
+        # PIL releases the GIL while transforming and encoding, so threads run variants in parallel
+        global _augment_pool
+        if _augment_pool is None:
+            _augment_pool = ThreadPoolExecutor(max_workers=settings.AUGMENT_WORKERS, thread_name_prefix="augment")
+        return _augment_pool
+
+    @staticmethod
+    def _render_preview(original: Image.Image, name: str, fmt: str) -> bytes:
+        return ClassificationService._encode_preview(AUGMENTATIONS[name](original), fmt)
 
     @staticmethod
-    def _img_to_base64(img: Image.Image) -> str:
+    def _encode_preview(img: Image.Image, fmt: str) -> bytes:
         buffered = io.BytesIO()
-        # Using PNG for better Base64 compatibility
-        img.save(buffered, format="PNG") 
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
-    
+        if fmt == "png":
+            img.save(buffered, format="PNG")
+        elif fmt == "webp":
+            # Fastest encoder effort: ~3x quicker than the default, files ~7% larger
+            img.save(buffered, format="WEBP", quality=settings.AUGMENT_QUALITY, method=0)
+        else:
+            img.save(buffered, format="JPEG", quality=settings.AUGMENT_QUALITY)
+        return buffered.getvalue()
+
     @staticmethod
-    def analyze_map(image_bytes: bytes, filename: str, patch_size: int = 64) -> dict:
+    def _cached_preview(image_id: str, name: str):
+        with _preview_lock:
+            body = _preview_cache.get((image_id, name))
+            if body is not None:
+                _preview_cache.move_to_end((image_id, name))
+            return body
+
+    @staticmethod
+    def _store_preview(image_id: str, name: str, body: bytes):
+        with _preview_lock:
+            _preview_cache[(image_id, name)] = body
+            _preview_cache.move_to_end((image_id, name))
+            while len(_preview_cache) > settings.AUGMENT_CACHE_ITEMS:
+                _preview_cache.popitem(last=False)
+
+    @staticmethod
+    def analyze_map(image_source, filename: str, patch_size: int = 64, stride: int = None,
+                    progress=None) -> dict:
         """
         Full map analysis triggered by POST /classification/analyze-map.
+        `image_source` is the upload's file object (decoded in place, no temp
+        file) or its bytes. A `stride` below patch_size runs overlapping
+        windows and reports the grid at stride resolution.
+        `progress(processed, total)` is called as patch bands finish (jobs API).
         """
         try:
-            import sys
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            backend_root = os.path.abspath(os.path.join(current_dir, "../../../"))
-            if backend_root not in sys.path:
-                sys.path.append(backend_root)
-                
-            from core import ai_engine
-            
-            # 1. Save temp image for the core analyzer (which expects a path)
-            import tempfile
-            with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                tmp.write(image_bytes)
-                tmp_path = tmp.name
-                
-            try:
-                result = ai_engine.get_image_analysis_data(tmp_path, patch_size=patch_size)
-                result["filename"] = filename
-                return result
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-                    
+            return ai_engine.get_image_analysis_data(
+                image_source,
+                patch_size=patch_size,
+                batch_size=settings.INFERENCE_BATCH_SIZE,
+                filename=filename,
+                stride=stride,
+                progress=progress
+            )
         except Exception as e:
             print(f"Error in analyze_map: {e}")
             raise e
 
+    @staticmethod
+    def analyze_map_compact(image_source, filename: str, patch_size: int = 64,
+                            fmt: str = "compact", confidence_dtype: str = "float16",
+                            stride: int = None) -> dict:
+        """
+        Compact encodings of the analyze-map grid, built straight from NumPy
+        (no per-cell Python objects). Labels are a row-major uint8 array of
+        indices into `classes`; confidences are float16 (0-100) or uint8
+        (rounded percent). `fmt` selects the payload:
+          - "compact": JSON with base64 arrays
+          - "binary":  raw bytes, labels followed by confidences
+          - "png":     palette PNG label map, one pixel per grid cell
+        Grid cells are `cell_size` pixels: patch_size, or `stride` when
+        overlapping windows are requested.
+        Returns {"media_type", "body", "headers"}; for "compact" body is a dict.
+        """
+        result = ai_engine.analyze_scene_arrays(
+            image_source, patch_size, settings.INFERENCE_BATCH_SIZE, stride=stride
+        )
+        with metrics.stage("serialize"):
+            return ClassificationService._encode_grid(result, filename, patch_size, fmt, confidence_dtype)
+
+    @staticmethod
+    def _encode_grid(result: dict, filename: str, patch_size: int, fmt: str, confidence_dtype: str) -> dict:
+        labels, classes = result["label_grid"], result["labels"]
+        rows, cols = labels.shape
+
+        if confidence_dtype == "uint8":
+            confidence = np.rint(result["confidence_grid"]).astype(np.uint8)
+        else:
+            confidence = result["confidence_grid"].astype("<f2")
+
+        meta = {
+            "filename": filename,
+            "image_width": result["image_width"],
+            "image_height": result["image_height"],
+            "patch_size": patch_size,
+            "cell_size": result["cell_size"],
+            "rows": rows,
+            "cols": cols,
+            "classes": classes,
+            "confidence_dtype": confidence_dtype
+        }
+
+        if fmt == "compact":
+            return {
+                "media_type": "application/json",
+                "headers": {},
+                "body": {
+                    **meta,
+                    "encoding": "base64",
+                    "labels": base64.b64encode(labels.tobytes()).decode('utf-8'),
+                    "confidence": base64.b64encode(confidence.tobytes()).decode('utf-8')
+                }
+            }
+
+        headers = {
+            "X-Image-Width": str(meta["image_width"]),
+            "X-Image-Height": str(meta["image_height"]),
+            "X-Patch-Size": str(patch_size),
+            "X-Cell-Size": str(result["cell_size"]),
+            "X-Grid-Rows": str(rows),
+            "X-Grid-Cols": str(cols),
+            "X-Classes": json.dumps(classes),
+            "X-Confidence-Dtype": confidence_dtype
+        }
+
+        if fmt == "png":
+            return {"media_type": "image/png", "headers": headers, "body": ClassificationService._label_png(labels, classes)}
+
+        return {
+            "media_type": "application/octet-stream",
+            "headers": headers,
+            "body": labels.tobytes() + confidence.tobytes()
+        }
+
+    @staticmethod
+    def _label_png(labels: np.ndarray, classes: list) -> bytes:
+        """Palette PNG of a (rows, cols) label index grid, one pixel per cell, CLASS_COLORS palette."""
+        rows, cols = labels.shape
+        label_map = Image.frombytes("P", (cols, rows), np.ascontiguousarray(labels).tobytes())
+        palette = []
+        for cls in classes:
+            palette.extend(settings.CLASS_COLORS.get(cls, [0, 0, 0]))
+        label_map.putpalette(palette)
+        buffered = io.BytesIO()
+        label_map.save(buffered, format="PNG", optimize=True)
+        return buffered.getvalue()
+
+    @staticmethod
+    def build_pyramid(data: bytes, patch_size: int = 64) -> tuple:
+        """
+        Zoom pyramid for POST /classification/pyramid, run on the inference
+        pool. The image id hashes the upload, patch size and prediction
+        fingerprint, so re-uploading the same scene is answered from the store
+        without inference. Returns (image_id, pyramid, cached); the caller
+        keeps it with store_pyramid() in the serving process, because process
+        workers only see their own copy of pyramid_store.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(ai_engine.prediction_fingerprint().encode())
+        digest.update(str(patch_size).encode())
+        digest.update(data)
+        image_id = digest.hexdigest()
+
+        pyramid = pyramid_store.get(image_id)
+        if pyramid is not None:
+            return image_id, pyramid, True
+        pyramid = ai_engine.build_pyramid(
+            data, patch_size, settings.INFERENCE_BATCH_SIZE, settings.PYRAMID_TILE_CELLS
+        )
+        return image_id, pyramid, False
+
+    @staticmethod
+    def store_pyramid(image_id: str, pyramid, cached: bool, filename: str) -> dict:
+        """Keeps a build_pyramid() result for the GET /pyramid routes and describes it."""
+        if not cached:
+            pyramid_store.put(image_id, pyramid)
+        return {
+            "image_id": image_id,
+            "filename": filename,
+            "cached": cached,
+            **ClassificationService._pyramid_meta(pyramid)
+        }
+
+    @staticmethod
+    def _pyramid_meta(pyramid) -> dict:
+        return {
+            "image_width": pyramid.image_width,
+            "image_height": pyramid.image_height,
+            "patch_size": pyramid.patch_size,
+            "tile_size": pyramid.tile_size,
+            "max_zoom": pyramid.max_zoom,
+            "classes": pyramid.classes,
+            "levels": pyramid.describe()
+        }
+
+    @staticmethod
+    def _get_pyramid(image_id: str):
+        pyramid = pyramid_store.get(image_id)
+        if pyramid is None:
+            raise KeyError(image_id)
+        return pyramid
+
+    @staticmethod
+    def _pyramid_cells(pyramid, labels, conf, cell_size, row0, col0) -> list:
+        """Cells of a pyramid slice in the analyze-map shape ({x, y, class, confidence})."""
+        cells = []
+        for r, (label_row, conf_row) in enumerate(zip(labels.tolist(), conf.tolist())):
+            for c, (label, confidence) in enumerate(zip(label_row, conf_row)):
+                cells.append({
+                    "x": (col0 + c) * cell_size, "y": (row0 + r) * cell_size,
+                    "class": pyramid.classes[label],
+                    "confidence": round(confidence, 2)
+                })
+        return cells
+
+    @staticmethod
+    def get_pyramid_info(image_id: str) -> dict:
+        """Levels of a stored pyramid. Raises KeyError for unknown ids."""
+        pyramid = ClassificationService._get_pyramid(image_id)
+        return {"image_id": image_id, **ClassificationService._pyramid_meta(pyramid)}
+
+    @staticmethod
+    def get_pyramid_tile(image_id: str, z: int, x: int, y: int, fmt: str = "json") -> dict:
+        """
+        XYZ tile of a stored pyramid: up to tile_size x tile_size cells of zoom z.
+        `fmt` "json" gives analyze-map style cells, "png" a palette label image.
+        Raises KeyError for unknown ids and ValueError for tiles outside the image.
+        """
+        pyramid = ClassificationService._get_pyramid(image_id)
+        labels, conf, cell_size, row0, col0 = pyramid.tile(z, x, y)
+        if fmt == "png":
+            return {"media_type": "image/png", "body": ClassificationService._label_png(labels, pyramid.classes)}
+        return {
+            "media_type": "application/json",
+            "body": {
+                "image_id": image_id, "z": z, "x": x, "y": y,
+                "cell_size": cell_size,
+                "grid": ClassificationService._pyramid_cells(pyramid, labels, conf, cell_size, row0, col0)
+            }
+        }
+
+    @staticmethod
+    def get_pyramid_window(image_id: str, z: int, x0: int, y0: int, x1: int, y1: int) -> dict:
+        """Cells of zoom z overlapping a viewport given in image pixels."""
+        pyramid = ClassificationService._get_pyramid(image_id)
+        labels, conf, cell_size, row0, col0 = pyramid.window(z, x0, y0, x1, y1)
+        return {
+            "image_id": image_id,
+            "image_width": pyramid.image_width,
+            "image_height": pyramid.image_height,
+            "z": z,
+            "patch_size": cell_size,
+            "grid": ClassificationService._pyramid_cells(pyramid, labels, conf, cell_size, row0, col0)
+        }
+
+    @staticmethod
+    def stream_map_analysis(image_source, filename: str, patch_size: int = 64):
+        """
+        Streaming variant of analyze_map for POST /classification/analyze-map/stream.
+        Yields NDJSON lines: one "meta" frame, then "cells" + "progress" frames per
+        finished inference batch, and a final "complete" frame. An "error" frame
+        ends the stream early (as the first frame when the upload can't be decoded).
+        """
+        import time
+
+        try:
+            img, (width, height), decode_scale = ai_engine.open_scene(image_source, patch_size)
+        except Exception as e:
+            # Always the first frame, so the route can still answer 400 instead of streaming
+            print(f"Error in stream_map_analysis: {e}")
+            yield json.dumps({"type": "error", "detail": f"Could not decode image: {e}"}) + "\n"
+            return
+        total = (-(-width // patch_size)) * (-(-height // patch_size))
+
+        yield json.dumps({
+            "type": "meta",
+            "filename": filename,
+            "image_width": width,
+            "image_height": height,
+            "patch_size": patch_size,
+            "total_patches": total
+        }) + "\n"
+
+        start = time.perf_counter()
+        processed = 0
+        try:
+            for cells in ai_engine.iter_grid_bands(img, patch_size, settings.INFERENCE_BATCH_SIZE, decode_scale):
+                processed += len(cells)
+                elapsed = time.perf_counter() - start
+                with metrics.stage("serialize"):
+                    frame = json.dumps({"type": "cells", "cells": cells}) + "\n"
+                yield frame
+                yield json.dumps({
+                    "type": "progress",
+                    "processed": processed,
+                    "total_patches": total,
+                    "elapsed_s": round(elapsed, 3),
+                    "patches_per_sec": round(processed / elapsed, 1) if elapsed > 0 else None
+                }) + "\n"
+        except Exception as e:
+            print(f"Error in stream_map_analysis: {e}")
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+            return
+
+        elapsed = time.perf_counter() - start
+        yield json.dumps({
+            "type": "complete",
+            "processed": processed,
+            "elapsed_s": round(elapsed, 3),
+            "patches_per_sec": round(processed / elapsed, 1) if elapsed > 0 else None
+        }) + "\n"
+
+    @staticmethod
+    def configure_engine():
+        """
+        Applies Settings to the core engine (metrics, inference backend, cascade, prediction cache).
+        Called once per process: from the app lifespan and by process-pool workers.
+        """
+        metrics.ENABLED = settings.METRICS_ENABLED
+        if ai_engine is None:
+            return
+        ai_engine.configure_backend(
+            name=settings.INFERENCE_BACKEND,
+            validation_dir=settings.BACKEND_VALIDATION_DIR,
+            validation_samples=settings.BACKEND_VALIDATION_SAMPLES,
+            min_agreement=settings.BACKEND_MIN_AGREEMENT
+        )
+        ai_engine.configure_cascade(
+            kind=settings.CASCADE_MODEL,
+            path=settings.CASCADE_MODEL_PATH,
+            threshold=settings.CASCADE_THRESHOLD
+        )
+        ai_engine.configure_cache(
+            enabled=settings.PREDICTION_CACHE_ENABLED,
+            max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+            disk_dir=settings.PREDICTION_CACHE_DIR
+        )
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        """
+        Hit/miss counters of the engine's prediction cache.
+        """
+        if ai_engine is None:
+            return {"enabled": False}
+        return ai_engine.cache_stats()
+
+    @staticmethod
+    def get_cascade_stats() -> dict:
+        """
+        Patches answered by each layer (heuristic, cache, cascade, model) and acceptance rates.
+        """
+        if ai_engine is None:
+            return {"cascade": None}
+        return ai_engine.cascade_stats()
+
     @staticmethod
     def get_model_leaderboard() -> list:
         """
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from .services import HealthService
+
+router = APIRouter(prefix="/health", tags=["Health"])
+
+@router.get("/live")
+async def liveness():
+    """Process is up and serving HTTP."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    """
+    Load balancer readiness probe: 200 once the model is loaded and warmed up, 503 before.
+    """
+    report = HealthService.readiness()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
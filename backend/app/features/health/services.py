@@ -0,0 +1,40 @@
+import os
+import time
+from app.core.engine import ai_engine
+from app.core.prefork import memory_report
+
+
+class HealthService:
+    _started_at = time.time()
+    _startup_error = None
+    # Torch thread layout applied by the lifespan (see prefork.thread_layout)
+    thread_layout = None
+
+    @staticmethod
+    def warm_up_model(batch_size: int = 1):
+        """
+        Called once from the app lifespan: loads the model and runs a warm-up pass.
+        Failures are recorded instead of raised so the process still serves /health.
+        """
+        try:
+            if ai_engine is None:
+                raise RuntimeError("core.ai_engine could not be imported")
+            ai_engine.warm_up(batch_size)
+            HealthService._startup_error = None
+        except Exception as e:
+            HealthService._startup_error = str(e)
+            print(f"⚠️ Warning: Model warm-up failed, replica will report not ready: {e}")
+
+    @staticmethod
+    def readiness() -> dict:
+        """
+        Ready only once the model is loaded and warmed up.
+        """
+        status = ai_engine.model_status() if ai_engine else {"model_loaded": False, "warmed_up": False}
+        return {
+            "ready": status["model_loaded"] and status["warmed_up"],
+            "uptime_s": round(time.time() - HealthService._started_at, 1),
+            "startup_error": HealthService._startup_error,
+            "process": {"pid": os.getpid(), "threads": HealthService.thread_layout, "memory": memory_report()},
+            **status
+        }
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import JSONResponse
+from .services import JobService, job_runner
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+@router.post("/analyze-map", status_code=202)
+async def submit_analyze_map(
+    file: UploadFile = File(...),
+    patch_size: int = 64
+):
+    """
+    Queues a full map analysis and returns its job id immediately.
+    Poll GET /jobs/{job_id} for progress; the analyze-map JSON is included once done.
+    Submitting a scene that is already queued, running or done (same bytes,
+    patch_size and model) returns that job instead ("deduplicated": true).
+    """
+    data = await file.read()
+    return await job_runner.submit_analyze_map(data, file.filename, patch_size)
+
+@router.get("/stats")
+async def job_stats():
+    """
+    Job queue limits and load: workers, queued/running jobs, jobs per status,
+    queue wait and run time percentiles.
+    """
+    return await job_runner.stats()
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, include_result: bool = True):
+    """
+    Job status: queued / running / done / failed, progress (patches processed),
+    queue wait and run time. `result` holds the analyze-map JSON when done.
+    """
+    job = await JobService.get_job(job_id, include_result)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    # Tell pollers to come back while the job is still pending
+    headers = {"Retry-After": "2"} if job["status"] in ("queued", "running") else None
+    return JSONResponse(content=job, headers=headers)
@@ -0,0 +1,395 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.engine import ai_engine, metrics
+from app.features.classification.services import ClassificationService
+
+# Job states, in order
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_COLUMNS = (
+    "id", "job_key", "kind", "filename", "patch_size", "status", "processed", "total",
+    "submitted_at", "started_at", "finished_at", "error", "owner", "result"
+)
+
+
+class JobStore:
+    """
+    SQLite-backed job records and results. One connection per process,
+    shared by job threads and serialized by a lock; the event loop only
+    reaches it through asyncio.to_thread. Every job records the identity
+    of the process that holds its upload (owner, see process_identity()).
+    The database is only opened on first use, not when the store is created.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._pid = None
+        self._lock = Lock()
+
+    def _conn(self):
+        """This process's connection: SQLite handles must not cross a fork (prefork workers)."""
+        if self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._pid = os.getpid()
+            with self._db:
+                self._create_schema()
+        return self._db
+
+    def _create_schema(self):
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, job_key TEXT, kind TEXT, filename TEXT, patch_size INTEGER,"
+            " status TEXT, processed INTEGER, total INTEGER,"
+            " submitted_at REAL, started_at REAL, finished_at REAL, error TEXT, owner TEXT,"
+            " result TEXT)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            # Databases created before owner existed: their jobs have no live owner
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (job_key, status)")
+
+    def recover(self) -> int:
+        """
+        Fails queued/running jobs whose owner process is gone: their uploads
+        lived in its memory. Jobs of live processes (other prefork workers)
+        are left alone; a restarted server that got its old pid back is a
+        different process and does not keep its predecessor's jobs.
+        Returns the number of jobs failed.
+        """
+        with self._lock, self._conn():
+            rows = self._db.execute(
+                "SELECT id, owner FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall()
+            orphans = [job_id for job_id, owner in rows if not _owner_alive(owner)]
+            self._db.executemany(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                [(FAILED, "Interrupted by a server restart, please resubmit", time.time(), job_id)
+                 for job_id in orphans]
+            )
+        return len(orphans)
+
+    def create_unique(self, job_key: str, kind: str, filename: str, patch_size: int, statuses):
+        """
+        Inserts a queued job unless one with this key is already in `statuses`.
+        Returns (job id, created); the check and insert are one locked step.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn():
+            existing = self._find(job_key, statuses)
+            if existing is not None:
+                return existing, False
+            self._db.execute(
+                "INSERT INTO jobs (id, job_key, kind, filename, patch_size, status, processed, total,"
+                " submitted_at, owner) VALUES (?, ?, ?, ?, ?, ?, 0, NULL, ?, ?)",
+                (job_id, job_key, kind, filename, patch_size, QUEUED, time.time(), process_identity())
+            )
+        return job_id, True
+
+    def update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn():
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str, include_result: bool = True):
+        columns = _COLUMNS if include_result else _COLUMNS[:-1]
+        with self._lock:
+            row = self._conn().execute(f"SELECT {', '.join(columns)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def find(self, job_key: str, statuses):
+        """Most recent job with this key in one of `statuses`, or None."""
+        with self._lock:
+            return self._find(job_key, statuses)
+
+    def _find(self, job_key: str, statuses):
+        marks = ", ".join("?" for _ in statuses)
+        row = self._conn().execute(
+            f"SELECT id FROM jobs WHERE job_key = ? AND status IN ({marks}) ORDER BY submitted_at DESC LIMIT 1",
+            (job_key, *statuses)
+        ).fetchone()
+        return row[0] if row else None
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def _proc_identity(pid: int):
+    """"<boot id>:<pid>:<start time>" from /proc, None when the process or /proc is missing."""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesized command name; starttime is field 22
+            start_time = f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+    return f"{boot_id}:{pid}:{start_time}"
+
+
+_identities = {}
+
+
+def process_identity() -> str:
+    """
+    Identity of this process for job ownership. A pid alone is reused (a
+    restarted container often gets its old one back), so it is qualified by
+    the process start time and boot id; without /proc by a random id drawn
+    once per process.
+    """
+    pid = os.getpid()
+    if pid not in _identities:
+        _identities[pid] = _proc_identity(pid) or f"{uuid.uuid4().hex}:{pid}:"
+    return _identities[pid]
+
+
+def _owner_alive(owner) -> bool:
+    if not owner:
+        return False
+    if owner == process_identity():
+        return True
+    pid = int(owner.split(":")[1])
+    if pid == os.getpid():
+        # Our pid, recorded by an earlier process
+        return False
+    identity = _proc_identity(pid)
+    if identity is not None:
+        return identity == owner
+    # No /proc: the pid is all that can be checked
+    return _process_alive(pid)
+
+
+def _process_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+
+class JobRunner:
+    """
+    Bounded background queue for long map analyses. Submissions return a job
+    id at once; `workers` jobs run concurrently on their own threads, at most
+    `max_queue` more wait (503 beyond that). Jobs that waited longer than
+    `max_wait_s` fail instead of starting, and a running job fails once it
+    exceeds `timeout_s` (checked between patch bands). Identical submissions
+    (same content hash, patch size and model) share one job.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 1, max_queue: int = 32,
+                 max_wait_s: float = 600, timeout_s: float = 1800, history: int = 1000):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.timeout_s = timeout_s
+        self._queue = None
+        # Queued job ids in queue order, for queue_position
+        self._queued = deque()
+        self._tasks = []
+        self._executor = None
+        self._uploads = {}
+        self._running = 0
+        self._wait_s = deque(maxlen=history)
+        self._run_s = deque(maxlen=history)
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is not None and self._tasks and self._tasks[0].get_loop() is loop:
+            return
+        self._queue = asyncio.Queue()
+        self._queued = deque()
+        self._executor = self._executor or ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    @staticmethod
+    def job_key(data: bytes, patch_size: int) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        if ai_engine is not None:
+            digest.update(ai_engine.prediction_fingerprint().encode())
+        digest.update(f"analyze-map:{patch_size}".encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    async def submit_analyze_map(self, data: bytes, filename: str, patch_size: int) -> dict:
+        """Queues an analyze-map job, or returns the existing job for identical input."""
+        self._start()
+        job_key = await asyncio.to_thread(self.job_key, data, patch_size)
+
+        existing = await asyncio.to_thread(self.store.find, job_key, (QUEUED, RUNNING, DONE))
+        if existing is not None:
+            return {"job_id": existing, "deduplicated": True, **await self._status(existing)}
+
+        if self._queue.qsize() >= self.max_queue:
+            raise HTTPException(
+                status_code=503,
+                detail="Job queue is full, please retry shortly",
+                headers={"Retry-After": "5"},
+            )
+
+        job_id, created = await asyncio.to_thread(
+            self.store.create_unique, job_key, "analyze-map", filename, patch_size, (QUEUED, RUNNING, DONE)
+        )
+        if not created:
+            # An identical submission was stored while this one was hashing
+            return {"job_id": job_id, "deduplicated": True, **await self._status(job_id)}
+        self._uploads[job_id] = data
+        self._queued.append(job_id)
+        await self._queue.put(job_id)
+        return {"job_id": job_id, "deduplicated": False, **await self._status(job_id)}
+
+    async def _status(self, job_id: str) -> dict:
+        job = await asyncio.to_thread(self.store.get, job_id, False)
+        return {"status": job["status"], "queue_position": self._position(job_id)}
+
+    def _position(self, job_id: str):
+        """1-based place in this process's queue, None when not queued here. Event loop only."""
+        try:
+            return self._queued.index(job_id) + 1
+        except ValueError:
+            return None
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self._queue.get()
+            self._queued.remove(job_id)
+            data = self._uploads.pop(job_id, None)
+            job = await asyncio.to_thread(self.store.get, job_id, False)
+            waited = time.time() - job["submitted_at"]
+            self._wait_s.append(waited)
+            metrics.observe_wait("jobs", waited)
+
+            if data is None or waited > self.max_wait_s:
+                await asyncio.to_thread(
+                    self.store.update, job_id, status=FAILED, finished_at=time.time(),
+                    error=f"Waited {waited:.0f}s in the queue (limit {self.max_wait_s:.0f}s)"
+                )
+                continue
+
+            self._running += 1
+            started = time.time()
+            try:
+                await loop.run_in_executor(self._executor, self._execute, job_id, data, job, started)
+            finally:
+                self._running -= 1
+                self._run_s.append(time.time() - started)
+                metrics.observe_stage("job_run", time.time() - started)
+
+    def _execute(self, job_id, data, job, started):
+        """Job thread: runs the analysis and stores its serialized result, all off the event loop."""
+        try:
+            self.store.update(job_id, status=RUNNING, started_at=started)
+            result = self._run_analyze_map(job_id, data, job["filename"], job["patch_size"], started)
+            self.store.update(job_id, status=DONE, finished_at=time.time(), result=json.dumps(result))
+        except Exception as e:
+            print(f"Error in job {job_id}: {e}")
+            self.store.update(job_id, status=FAILED, finished_at=time.time(), error=str(e))
+
+    def _run_analyze_map(self, job_id, data, filename, patch_size, started):
+        last_write = [0.0]
+
+        def progress(processed, total):
+            now = time.time()
+            if now - started > self.timeout_s:
+                raise TimeoutError(f"Job exceeded {self.timeout_s:.0f}s")
+            # Throttle progress writes to ~2 per second
+            if now - last_write[0] >= 0.5 or processed == total:
+                last_write[0] = now
+                self.store.update(job_id, processed=processed, total=total)
+
+        return ClassificationService.analyze_map(data, filename, patch_size, progress=progress)
+
+    @staticmethod
+    def _percentiles(values) -> dict:
+        if not values:
+            return {"p50": None, "p95": None, "max": None}
+        ordered = sorted(values)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+        return {"p50": pick(0.50), "p95": pick(0.95), "max": round(ordered[-1], 3)}
+
+    async def stats(self) -> dict:
+        counts = await asyncio.to_thread(self.store.counts)
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait_s,
+            "timeout_s": self.timeout_s,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": self._running,
+            "jobs_by_status": counts,
+            "queue_wait_s": self._percentiles(self._wait_s),
+            "run_time_s": self._percentiles(self._run_s),
+        }
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+job_runner = JobRunner(
+    JobStore(settings.JOB_DB_PATH),
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_MAX_QUEUE,
+    max_wait_s=settings.JOB_MAX_WAIT_S,
+    timeout_s=settings.JOB_TIMEOUT_S,
+)
+
+
+class JobService:
+    @staticmethod
+    async def get_job(job_id: str, include_result: bool = True):
+        """
+        Job status for GET /jobs/{id}: progress, timestamps, queue wait and
+        run time, plus the analyze-map result once done. None if unknown.
+        SQLite reads and result parsing run off the event loop.
+        """
+        job = await asyncio.to_thread(job_runner.store.get, job_id, include_result)
+        if job is None:
+            return None
+
+        now = time.time()
+        started, finished = job["started_at"], job["finished_at"]
+        total = job["total"]
+        report = {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "filename": job["filename"],
+            "patch_size": job["patch_size"],
+            "status": job["status"],
+            "progress": {
+                "processed": job["processed"],
+                "total": total,
+                "percent": round(100 * job["processed"] / total, 1) if total else None,
+            },
+            "queue_position": job_runner._position(job_id),
+            "queue_wait_s": round((started or finished or now) - job["submitted_at"], 3),
+            "run_time_s": round((finished or now) - started, 3) if started else None,
+            "error": job["error"],
+        }
+        if include_result and job.get("result"):
+            report["result"] = await asyncio.to_thread(json.loads, job["result"])
+        return report
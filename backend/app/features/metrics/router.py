@@ -0,0 +1,28 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.core.engine import metrics
+from app.core.executor import inference_pool
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus text exposition: per-stage latency histograms, heuristic vs
+    cache vs model patch counters, queue waits, batch sizes, model load time
+    and current inference pool load.
+    With the process executor, engine metrics stay in the worker processes.
+    """
+    pool = inference_pool.stats()
+    lines = [
+        "# HELP vega_inference_in_flight Requests running or queued on the inference pool.",
+        "# TYPE vega_inference_in_flight gauge",
+        f"vega_inference_in_flight {pool['in_flight']}",
+        "# HELP vega_inference_queued Requests waiting for an inference worker.",
+        "# TYPE vega_inference_queued gauge",
+        f"vega_inference_queued {pool['queued']}",
+    ]
+    return PlainTextResponse(
+        metrics.render() + "\n".join(lines) + "\n",
+        media_type="text/plain; version=0.0.4"
+    )
@@ -1,19 +1,30 @@
+from contextlib import aclosing
+from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from .services import TrainingService
 
 router = APIRouter(prefix="/training", tags=["Training"])
 
 @router.websocket("/ws/start")
-async def websocket_training_endpoint(websocket: WebSocket):
+async def websocket_training_endpoint(
+    websocket: WebSocket,
+    epochs: Optional[int] = None,
+    freeze_backbone: Optional[bool] = None,
+    batch_size: Optional[int] = None,
+    lr: Optional[float] = None
+):
+    """
+    Fine-tunes the model on the labelled patches in TRAINING_DATA_DIR and
+    streams per-epoch metrics. Query params override the TRAINING_* settings.
+    Disconnecting stops the run; the best checkpoint so far stays on disk.
+    """
     await websocket.accept()
     try:
-        # Stream training logs
-        async for metrics in TrainingService.simulate_training_loop():
-            await websocket.send_text(metrics)
-            
-        # Send completion message
-        await websocket.send_text('{"status": "complete", "message": "Model Training Finished Successfully"}')
+        # Stream training logs; aclosing stops the run as soon as the client leaves
+        async with aclosing(TrainingService.run_training(epochs, freeze_backbone, batch_size, lr)) as stream:
+            async for message in stream:
+                await websocket.send_text(message)
         await websocket.close()
-        
+
     except WebSocketDisconnect:
-        print("Client disconnected from training stream")
\ No newline at end of file
+        print("Client disconnected from training stream")
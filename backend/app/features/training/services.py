@@ -1,37 +1,124 @@
 import asyncio
-import random
 import json
+import os
+import threading
+from app.core.config import settings
+from app.core.engine import ai_engine
+
+_DONE = object()
+
 
 class TrainingService:
     @staticmethod
-    async def simulate_training_loop():
+    def _run_lock(training):
+        """
+        One fine-tuning run at a time across all serving processes: runs share
+        the decoded-patch memmaps in TRAINING_CACHE_DIR and the output checkpoint.
+        """
+        directory = settings.TRAINING_CACHE_DIR or os.path.dirname(settings.TRAINING_OUTPUT_PATH) or "."
+        return training.RunLock(directory)
+
+    @staticmethod
+    async def run_training(epochs: int = None, freeze_backbone: bool = None,
+                           batch_size: int = None, lr: float = None):
         """
-        Generator that simulates a real ML training process.
-        Yields metrics for every epoch.
+        Fine-tunes the served ResNet50 on TRAINING_DATA_DIR (core/training.py)
+        and yields one JSON message per event: start, feature extraction,
+        every epoch (true loss / accuracy, samples/sec, loader stall time),
+        then a final status "complete" or "error".
+        Training runs on its own thread, so the event loop keeps serving
+        inference; closing the generator (client gone) stops it between batches.
         """
-        epochs = 20
-        accuracy = 0.45  # Starting accuracy
-        loss = 2.5       # Starting loss
-
-        for i in range(1, epochs + 1):
-            # Simulate processing time
-            await asyncio.sleep(1) 
-            
-            # Simulate model improvement
-            accuracy += random.uniform(0.01, 0.05)
-            loss -= random.uniform(0.05, 0.2)
-            
-            # Cap values
-            if accuracy > 0.98: accuracy = 0.98
-            if loss < 0.1: loss = 0.1
-            
-            metrics = {
-                "epoch": i,
-                "total_epochs": epochs,
-                "accuracy": round(accuracy, 4),
-                "loss": round(loss, 4),
-                "gpu_util": random.randint(70, 95), # PDF Page 7 requirement
-                "log": f"Epoch [{i}/{epochs}] - Loss: {loss:.4f} - Acc: {accuracy:.4f}"
-            }
-            
-            yield json.dumps(metrics)
\ No newline at end of file
+        if ai_engine is None:
+            yield json.dumps({"status": "error", "message": "core.ai_engine could not be imported"})
+            return
+        # Import before taking the lock: only the training thread releases it
+        try:
+            from core import training
+        except Exception as e:
+            yield json.dumps({"status": "error", "message": f"core.training could not be imported: {e}"})
+            return
+        run_lock = TrainingService._run_lock(training)
+        if not run_lock.acquire():
+            yield json.dumps({"status": "error", "message": "A training run is already in progress"})
+            return
+
+        epochs = epochs or settings.TRAINING_EPOCHS
+        freeze_backbone = settings.TRAINING_FREEZE_BACKBONE if freeze_backbone is None else freeze_backbone
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def run():
+            try:
+                events = training.train(
+                    settings.TRAINING_DATA_DIR,
+                    settings.TRAINING_OUTPUT_PATH,
+                    epochs=epochs,
+                    batch_size=batch_size or settings.TRAINING_BATCH_SIZE,
+                    lr=lr or settings.TRAINING_LR,
+                    freeze_backbone=freeze_backbone,
+                    val_split=settings.TRAINING_VAL_SPLIT,
+                    workers=settings.TRAINING_LOADER_WORKERS,
+                    cache_dir=settings.TRAINING_CACHE_DIR,
+                    init_path=ai_engine.MODEL_PATH,
+                    should_stop=stop.is_set,
+                )
+                for event in events:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+                loop.call_soon_threadsafe(queue.put_nowait, {"event": "complete"})
+            except InterruptedError:
+                pass
+            except Exception as e:
+                print(f"Training Error: {e}")
+                loop.call_soon_threadsafe(queue.put_nowait, {"event": "error", "message": str(e)})
+            finally:
+                run_lock.release()
+                loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+
+        try:
+            threading.Thread(target=run, name="training", daemon=True).start()
+        except BaseException:
+            run_lock.release()
+            raise
+        try:
+            while True:
+                event = await queue.get()
+                if event is _DONE:
+                    break
+                yield json.dumps(TrainingService._message(event))
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _message(event: dict) -> dict:
+        """Training event -> WebSocket message (epoch messages keep the demo page's keys)."""
+        kind = event["event"]
+        if kind == "start":
+            mode = "fc head on cached backbone features" if event["freeze_backbone"] else "full network"
+            return {**event, "status": "started",
+                    "log": f"Training {mode} on {event['train_samples']} patches "
+                           f"({event['val_samples']} validation), classes: {', '.join(event['classes'])}"}
+        if kind == "features":
+            source = "loaded from cache" if event["cached"] else (
+                f"extracted in {event['seconds']}s ({event['samples_per_sec']} samples/s, "
+                f"loader stall {event['loader_stall_s']}s)")
+            return {**event, "status": "features", "log": f"Backbone features for {event['samples']} patches {source}"}
+        if kind == "error":
+            return {"status": "error", "message": event["message"]}
+        if kind == "complete":
+            return {"status": "complete", "message": "Model Training Finished Successfully",
+                    "checkpoint": os.path.abspath(settings.TRAINING_OUTPUT_PATH)}
+
+        # Epoch: report validation metrics when there is a validation split
+        accuracy = event["val_accuracy"] if event["val_accuracy"] is not None else event["train_accuracy"]
+        loss = event["val_loss"] if event["val_loss"] is not None else event["train_loss"]
+        return {
+            **event,
+            "total_epochs": event["epochs"],
+            "accuracy": accuracy,
+            "loss": loss,
+            "log": (f"Epoch [{event['epoch']}/{event['epochs']}] - Loss: {loss:.4f} - Acc: {accuracy:.4f} - "
+                    f"{event['samples_per_sec']} samples/s - loader stall {event['loader_stall_s']}s"
+                    + (" - checkpoint saved" if event["checkpoint_saved"] else ""))
+        }
@@ -1,11 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from app.features.classification.router import router as classification_router
 from app.features.training.router import router as training_router
+from app.features.health.router import router as health_router
+from app.features.metrics.router import router as metrics_router
+from app.features.jobs.router import router as jobs_router
+from app.features.jobs.services import job_runner
+from app.features.health.services import HealthService
+from app.features.classification.services import ClassificationService
 from app.core.config import settings
+from app.core.executor import inference_pool
+from app.core.server_timing import ServerTimingMiddleware
+from app.core.prefork import apply_thread_layout, serve, thread_layout, worker_report
 
-app = FastAPI(title=settings.PROJECT_NAME)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # This process's share of the CPU budget, before any inference runs
+    layout = thread_layout()
+    apply_thread_layout(layout)
+    HealthService.thread_layout = layout
+    ClassificationService.configure_engine()
+    # Jobs whose owner process died with their uploads (other workers' jobs survive)
+    recovered = await asyncio.to_thread(job_runner.store.recover)
+    if recovered:
+        print(f"⚠️ Warning: Marked {recovered} interrupted job(s) as failed.")
+    # Load + warm up the model before traffic arrives (off the event loop)
+    if settings.WARMUP_ON_STARTUP:
+        await asyncio.to_thread(HealthService.warm_up_model, settings.WARMUP_BATCH_SIZE)
+    print(worker_report(layout))
+    yield
+    job_runner.shutdown()
+    inference_pool.shutdown()
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
+
+if settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
 
 # CORS — allow Next.js dev server and any localhost origin
 app.add_middleware(
@@ -17,15 +50,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Metadata of binary / PNG analyze-map responses
+    expose_headers=[
+        "X-Image-Width", "X-Image-Height", "X-Patch-Size", "X-Cell-Size",
+        "X-Grid-Rows", "X-Grid-Cols", "X-Classes", "X-Confidence-Dtype",
+        "Server-Timing",
+    ],
 )
 
 # Include Routers
 app.include_router(classification_router)
 app.include_router(training_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
+app.include_router(jobs_router)
 
 # Mount Static Folder for the Demo
 app.mount("/", StaticFiles(directory="app/static", html=True), name="static")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if settings.SERVER_WORKERS > 1:
+        # Prefork: one model load, weights shared by all workers
+        serve(app)
+    else:
+        import uvicorn
+        uvicorn.run(app, host=settings.SERVER_HOST, port=settings.SERVER_PORT)
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+Benchmark harness for the inference engine and the /classification routes.
+
+Runs without the real isro_model.pth: a randomly initialized ResNet50
+checkpoint with the production class list is written to a temp dir and the
+engine is pointed at it. Scenes are synthetic (smooth terrain-like noise with
+dark and blue regions, so the heuristic filter fires as well as the model).
+
+Usage (from backend/):
+    python benchmarks/run_benchmarks.py --sizes 1024x1024,2048x2048 --output bench.json
+
+Everything measured goes into one JSON document, so two runs can be diffed.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import models
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+CLASS_NAMES = ["Agricultural Land", "Barren Land", "Forest", "Urban Area", "Water Body"]
+
+
+# ==========================================
+# 1. FIXTURES: RANDOM CHECKPOINT + SYNTHETIC SCENES
+# ==========================================
+def write_random_checkpoint(directory, seed=0):
+    """Saves a randomly initialized ResNet50 in the isro_model.pth layout."""
+    torch.manual_seed(seed)
+    model = models.resnet50()
+    model.fc = nn.Linear(model.fc.in_features, len(CLASS_NAMES))
+    path = os.path.join(directory, "bench_model.pth")
+    torch.save({"class_names": CLASS_NAMES, "model_state_dict": model.state_dict()}, path)
+    return path
+
+
+def synthetic_scene(width, height, seed=0):
+    """(height, width, 3) uint8 scene: smooth noise with shadow and water patches mixed in."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(40, 220, (max(2, height // 128), max(2, width // 128), 3)).astype(np.uint8)
+    scene = np.asarray(Image.fromarray(coarse).resize((width, height), Image.BILINEAR)).copy()
+    scene = np.clip(scene.astype(np.int16) + rng.integers(-12, 13, scene.shape), 0, 255).astype(np.uint8)
+
+    # Rectangles the heuristics should claim: shadows and open water
+    for _ in range(max(1, width * height // 2_000_000)):
+        x, y = rng.integers(0, max(1, width - 256)), rng.integers(0, max(1, height - 256))
+        scene[y:y + 256, x:x + 256] = (20, 20, 25)
+        x, y = rng.integers(0, max(1, width - 256)), rng.integers(0, max(1, height - 256))
+        scene[y:y + 256, x:x + 256] = (30, 60, 140)
+    return scene
+
+
+def synthetic_patch(size, seed=0):
+    """Vegetation-coloured noise patch: never claimed by the heuristics, always hits the model."""
+    rng = np.random.default_rng(seed)
+    base = np.array([110, 140, 80], dtype=np.int16)
+    return np.clip(base + rng.integers(-25, 26, (size, size, 3)), 0, 255).astype(np.uint8)
+
+
+def encode(arr, fmt):
+    buffered = io.BytesIO()
+    Image.fromarray(arr).save(buffered, format=fmt, quality=90)
+    return buffered.getvalue()
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = np.sort(np.asarray(values))
+    pick = lambda q: round(float(ordered[min(len(ordered) - 1, int(q * len(ordered)))]), 2)
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(float(ordered[-1]), 2)}
+
+
+def timed(fn, repeats):
+    """Best and mean wall time (seconds) of fn() over `repeats` runs, plus the last result."""
+    times, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times), sum(times) / len(times), result
+
+
+# ==========================================
+# 2. ENGINE BENCHMARKS
+# ==========================================
+def bench_stages(ai_engine, data, patch_size, batch_size):
+    """
+    One pass over a scene with each engine stage timed separately:
+    decode -> heuristics -> preprocess -> forward -> serialize.
+    """
+    stages = {}
+
+    started = time.perf_counter()
+    arr = np.asarray(ai_engine._load_rgb_image(data))
+    stages["decode"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    blocks = ai_engine._patch_grid(arr, patch_size)
+    flat = blocks.reshape(-1, patch_size, patch_size, 3)
+    means, brightness = ai_engine._channel_stats(flat)
+    shadow, water = ai_engine._heuristic_masks(means, brightness)
+    pending = np.flatnonzero(~(shadow | water))
+    stages["heuristics"] = time.perf_counter() - started
+
+    stages["preprocess"] = 0.0
+    stages["forward"] = 0.0
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        started = time.perf_counter()
+        batch = ai_engine._preprocess_batch([flat[i] for i in chunk])
+        stages["preprocess"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with torch.no_grad():
+            torch.softmax(ai_engine._model(batch), dim=1)
+        stages["forward"] += time.perf_counter() - started
+
+    result = ai_engine.analyze_single_image(data, patch_size, batch_size)
+    started = time.perf_counter()
+    json.dumps(result)
+    stages["serialize"] = time.perf_counter() - started
+
+    total = sum(stages.values())
+    return {
+        "patches": len(flat),
+        "model_patches": len(pending),
+        "stage_ms": {name: round(seconds * 1000, 2) for name, seconds in stages.items()},
+        "stage_share": {name: round(seconds / total, 3) for name, seconds in stages.items()},
+    }
+
+
+def bench_engine(ai_engine, scenes, args):
+    report = {"predict_patch": None, "analyze_single_image": []}
+
+    patch = encode(synthetic_patch(args.patch_size, seed=99), "PNG")
+    best, mean, _ = timed(lambda: ai_engine.predict_patch(patch), args.repeats * 5)
+    report["predict_patch"] = {"best_ms": round(best * 1000, 2), "mean_ms": round(mean * 1000, 2)}
+
+    for (width, height), data in scenes:
+        best, mean, result = timed(
+            lambda: ai_engine.analyze_single_image(data, args.patch_size, args.batch_size), args.repeats
+        )
+        patches = len(result["grid"])
+        report["analyze_single_image"].append({
+            "size": f"{width}x{height}",
+            "format": args.format,
+            "encoded_mb": round(len(data) / 1e6, 2),
+            "patches": patches,
+            "best_s": round(best, 3),
+            "mean_s": round(mean, 3),
+            "patches_per_s": round(patches / best, 1),
+            "stages": bench_stages(ai_engine, data, args.patch_size, args.batch_size),
+            "peak_rss_mb": peak_rss_mb(),
+        })
+    return report
+
+
+# ==========================================
+# 3. HTTP BENCHMARKS (IN-PROCESS ASGI)
+# ==========================================
+async def hammer(client, method, url, make_kwargs, clients, requests):
+    """`clients` concurrent loops sending `requests` total; per-request latency and status counts."""
+    latencies, statuses = [], {}
+    remaining = [requests]
+
+    async def worker():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            started = time.perf_counter()
+            response = await client.request(method, url, **make_kwargs())
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "requests": requests,
+        "status_counts": {str(k): v for k, v in sorted(statuses.items())},
+        "requests_per_s": round(requests / elapsed, 2),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+async def bench_http(scenes, args):
+    import httpx
+    from app.main import app
+    from app.features.classification.router import predict_batcher
+
+    patch = encode(synthetic_patch(args.patch_size, seed=7), "PNG")
+    (width, height), scene = scenes[0]
+    mime = "image/png" if args.format == "PNG" else "image/jpeg"
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        report = {}
+        for clients in args.clients:
+            report[f"predict@{clients}"] = await hammer(
+                client, "POST", "/classification/predict",
+                lambda: {"files": {"file": ("patch.png", patch, "image/png")}},
+                clients, args.requests
+            )
+        report["predict_batching"] = predict_batcher.stats()
+
+        for clients in args.clients:
+            report[f"analyze_map@{clients}"] = await hammer(
+                client, "POST", f"/classification/analyze-map?patch_size={args.patch_size}",
+                lambda: {"files": {"file": ("scene", scene, mime)}},
+                clients, max(clients, args.requests // 8)
+            )
+        report["analyze_map_scene"] = f"{width}x{height}"
+    return report
+
+
+# ==========================================
+# 4. ENTRY POINT
+# ==========================================
+def main():
+    parser = argparse.ArgumentParser(description="VEGA inference benchmarks")
+    parser.add_argument("--sizes", default="1024x1024,2048x2048", help="comma separated WxH scene sizes")
+    parser.add_argument("--format", default="PNG", choices=["PNG", "JPEG", "TIFF"])
+    parser.add_argument("--patch-size", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--backend", default="eager", help="inference backend (see core/backends.py)")
+    parser.add_argument("--clients", default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--model", default=None, help="checkpoint to use instead of a random ResNet50")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--output", default=None, help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+    args.clients = [int(c) for c in args.clients.split(",")]
+
+    from app.core.engine import ai_engine
+    from app.features.classification.services import ClassificationService
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ai_engine.MODEL_PATH = args.model or write_random_checkpoint(tmp)
+        ClassificationService.configure_engine()
+        ai_engine.configure_backend(args.backend)
+        # Repeated runs over the same scene would otherwise measure the cache
+        ai_engine.configure_cache(enabled=False)
+
+        started = time.perf_counter()
+        ai_engine.warm_up(batch_size=min(8, args.batch_size))
+        startup_s = time.perf_counter() - started
+
+        scenes = []
+        for i, size in enumerate(args.sizes.split(",")):
+            width, height = parse_size(size)
+            scenes.append(((width, height), encode(synthetic_scene(width, height, seed=i), args.format)))
+
+        report = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": {
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "torch_threads": torch.get_num_threads(),
+            },
+            "config": {k: v for k, v in vars(args).items() if k != "output"},
+            "model": {"startup_s": round(startup_s, 3), **ai_engine.model_status()},
+            "preprocess_parity_max_delta": round(ai_engine.preprocess_parity(), 5),
+            "engine": bench_engine(ai_engine, scenes, args),
+        }
+        if not args.skip_http:
+            report["http"] = asyncio.run(bench_http(scenes, args))
+        report["peak_rss_mb"] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"✅ Benchmark written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import copy
+import time
+import tempfile
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Backends that can run the classifier, see build_backend()
+BACKENDS = ("eager", "torchscript", "int8_dynamic", "int8_static", "onnx")
+
+
+class OnnxBackend:
+    """
+    Runs an exported ONNX graph through onnxruntime (CPU) behind the same
+    tensor-in / logits-out call signature as the PyTorch model.
+    """
+
+    def __init__(self, model, example, path=None, threads=None):
+        import onnxruntime as ort
+
+        if path is None:
+            handle, path = tempfile.mkstemp(suffix=".onnx")
+            os.close(handle)
+        torch.onnx.export(
+            model, example, path,
+            input_names=["input"], output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17,
+            dynamo=False
+        )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, batch):
+        logits = self._session.run(None, {"input": batch.cpu().numpy()})[0]
+        return torch.from_numpy(logits)
+
+
+def _quantize_static(model, example, calibration):
+    """Post-training static int8 (FX graph mode): observes activations on `calibration` batches."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model), get_default_qconfig_mapping(engine), (example,))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def build_backend(name, model, example, calibration=(), onnx_path=None):
+    """
+    Wraps an eval-mode fp32 model into the requested CPU inference backend.
+    Every backend is called like the model: float (N, 3, 224, 224) in, logits out.
+      - eager:        the model itself
+      - torchscript:  traced, frozen and optimized for inference
+      - int8_dynamic: Linear layers quantized to int8 at load time
+      - int8_static:  conv + linear int8 calibrated on `calibration` batches
+      - onnx:         exported graph run by onnxruntime (optional dependency)
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+    if name == "eager":
+        return model
+
+    model = model.eval()
+    if name == "torchscript":
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+            return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+    if name == "int8_dynamic":
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+    if name == "int8_static":
+        if not calibration:
+            raise ValueError("int8_static needs calibration batches")
+        return _quantize_static(model, example, calibration)
+
+    return OnnxBackend(model, example, path=onnx_path)
+
+
+def compare_backends(reference, candidate, batches, repeats=1):
+    """
+    Checks `candidate` against the eager `reference` model on validation batches.
+    Returns top-1 agreement, the largest softmax probability difference and
+    the measured per-image latency of both (best of `repeats` runs).
+    """
+    def run(fn):
+        outputs, best = None, None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            with torch.no_grad():
+                outputs = [torch.softmax(fn(batch), dim=1) for batch in batches]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return torch.cat(outputs), best
+
+    ref_probs, ref_time = run(reference)
+    cand_probs, cand_time = run(candidate)
+    images = len(ref_probs)
+
+    agreement = (ref_probs.argmax(dim=1) == cand_probs.argmax(dim=1)).float().mean().item()
+    return {
+        "samples": images,
+        "top1_agreement": round(agreement, 4),
+        "max_prob_delta": round((ref_probs - cand_probs).abs().max().item(), 4),
+        "eager_ms_per_image": round(ref_time * 1000 / images, 2),
+        "backend_ms_per_image": round(cand_time * 1000 / images, 2),
+        "speedup": round(ref_time / cand_time, 2) if cand_time else None,
+    }
+
+
+def synthetic_patches(count, size=224, seed=0):
+    """
+    Smooth random uint8 (size, size, 3) patches: upsampled coarse noise, so
+    activations resemble natural imagery more than white noise does.
+    Used for calibration / validation when no validation images are configured.
+    """
+    rng = np.random.default_rng(seed)
+    coarse = torch.from_numpy(rng.integers(0, 256, (count, 3, 8, 8)).astype(np.float32))
+    smooth = nn.functional.interpolate(coarse, size=(size, size), mode="bilinear", align_corners=False)
+    return smooth.clamp(0, 255).to(torch.uint8).permute(0, 2, 3, 1).numpy()
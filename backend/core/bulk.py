@@ -0,0 +1,346 @@
+"""
+Offline bulk classification over a directory or manifest of scenes.
+
+Scenes are sharded over a process pool; every worker loads its own model
+once and runs with a fixed number of intra-op threads so that
+workers x threads matches the cores. The parent process is the only writer:
+results are streamed to NDJSON (one scene per line, row-major label indices
+and confidences) or Parquet (one row per cell, needs pyarrow), and every
+scene whose output is complete on disk is appended to a checkpoint so an
+interrupted run resumes where it stopped.
+
+Usage (from backend/):
+    python -m core.bulk --input /data/scenes --output results.ndjson --workers 4
+    python -m core.bulk --manifest scenes.txt --format parquet --output results/
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+SCENE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".npy")
+
+
+# ==========================================
+# 1. INPUTS + CHECKPOINT
+# ==========================================
+def find_scenes(input_dir=None, manifest=None):
+    """Scene paths from a directory walk (sorted) or a manifest (one path per line, or JSONL with "path")."""
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        paths = []
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                path = json.loads(line)["path"] if line.startswith("{") else line
+                paths.append(path if os.path.isabs(path) else os.path.join(base, path))
+        return paths
+
+    return sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(input_dir)
+        for name in names
+        if name.lower().endswith(SCENE_EXTENSIONS)
+    )
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+# ==========================================
+# 2. WORKERS
+# ==========================================
+def _init_worker(model_path, backend, threads, batch_size):
+    """Process pool initializer: pin intra-op threads, then load + warm up one model per worker."""
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already set (e.g. a torch call ran first in this process)
+        pass
+
+    from core import ai_engine, metrics
+    # Nothing scrapes /metrics offline
+    metrics.ENABLED = False
+    if model_path:
+        ai_engine.MODEL_PATH = model_path
+    ai_engine.INFERENCE_BATCH_SIZE = batch_size
+    ai_engine.configure_backend(backend)
+    # Nightly scenes are all distinct: skip per-patch hashing
+    ai_engine.configure_cache(enabled=False)
+    ai_engine.warm_up(batch_size=min(8, batch_size))
+
+
+def _classify_scene(path, patch_size):
+    from core import ai_engine
+    started = time.perf_counter()
+    try:
+        result = ai_engine.analyze_scene_arrays(path, patch_size)
+    except Exception as e:
+        return {"path": path, "error": f"{type(e).__name__}: {e}"}
+    result["path"] = path
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+# ==========================================
+# 3. OUTPUT WRITERS
+# ==========================================
+# Writers: write() returns the scene paths whose output is now complete on
+# disk (only those may be checkpointed), close() those of the last part, and
+# finished() the scenes an earlier run completed but may not have checkpointed
+class NdjsonWriter:
+    """
+    One JSON line per scene; label_grid / confidence_grid are row-major nested lists.
+    A line is complete once flushed. A crash can leave a torn last line, which is
+    cut on open, or a full line the checkpoint missed, which finished() reports.
+    """
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            _truncate_torn_line(path)
+        self.path = path
+        self._file = open(path, "a")
+
+    def finished(self):
+        done = set()
+        with open(self.path) as f:
+            for line in f:
+                record = json.loads(line)
+                if "error" not in record:
+                    done.add(record["path"])
+        return done
+
+    def write(self, result):
+        self._file.write(json.dumps({
+            "path": result["path"],
+            "image_width": result["image_width"],
+            "image_height": result["image_height"],
+            "patch_size": result["patch_size"],
+            "cell_size": result["cell_size"],
+            "classes": result["labels"],
+            "label_grid": result["label_grid"].tolist(),
+            "confidence_grid": result["confidence_grid"].tolist(),
+        }) + "\n")
+        self._file.flush()
+        return [result["path"]]
+
+    def write_error(self, path, error):
+        self._file.write(json.dumps({"path": path, "error": error}) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        return []
+
+
+def _truncate_torn_line(path):
+    """Cuts a file back to its last newline (the tail of a line cut off by a crash)."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(pos, 1 << 16)
+            pos -= step
+            f.seek(pos)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                pos += newline + 1
+                break
+        if pos != end:
+            f.truncate(pos)
+
+
+class ParquetWriter:
+    """
+    One row per grid cell (path, x, y, class, confidence), one row group per
+    scene, `scenes_per_part` scenes per part file. Parts are written under a
+    .tmp name and renamed once closed (a Parquet file is unreadable before
+    its footer is written), so a crash loses at most the open part and
+    resumed runs never rewrite finished ones.
+    """
+
+    def __init__(self, directory, scenes_per_part=16):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        self._pa = pa
+        self._pq = pq
+        self.directory = directory
+        self.scenes_per_part = scenes_per_part
+        self._schema = pa.schema([
+            ("path", pa.string()), ("x", pa.int32()), ("y", pa.int32()),
+            ("class", pa.dictionary(pa.int8(), pa.string())), ("confidence", pa.float32()),
+        ])
+        self._part = sum(name.endswith(".parquet") for name in os.listdir(directory))
+        self._writer = None
+        self._tmp_path = None
+        self._scenes = []
+        self._errors = open(os.path.join(directory, "errors.ndjson"), "a")
+
+    def finished(self):
+        done = set()
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                table = self._pq.read_table(os.path.join(self.directory, name), columns=["path"])
+                done.update(table.column("path").unique().to_pylist())
+        return done
+
+    def _part_path(self):
+        while os.path.exists(os.path.join(self.directory, f"part-{self._part:05d}.parquet")):
+            self._part += 1
+        return os.path.join(self.directory, f"part-{self._part:05d}.parquet")
+
+    def write(self, result):
+        import numpy as np
+        pa = self._pa
+        labels, conf, cell = result["label_grid"], result["confidence_grid"], result["cell_size"]
+        rows, cols = labels.shape
+        ys, xs = np.divmod(np.arange(rows * cols, dtype=np.int32), cols)
+        table = pa.table({
+            "path": pa.array([result["path"]] * (rows * cols), pa.string()),
+            "x": pa.array(xs * cell, pa.int32()),
+            "y": pa.array(ys * cell, pa.int32()),
+            "class": pa.DictionaryArray.from_arrays(
+                pa.array(labels.ravel().astype(np.int8)), pa.array(result["labels"], pa.string())
+            ),
+            "confidence": pa.array(conf.ravel().astype(np.float32)),
+        }, schema=self._schema)
+        if self._writer is None:
+            self._tmp_path = self._part_path() + ".tmp"
+            self._writer = self._pq.ParquetWriter(self._tmp_path, self._schema)
+        self._writer.write_table(table)
+        self._scenes.append(result["path"])
+        if len(self._scenes) >= self.scenes_per_part:
+            return self._finish_part()
+        return []
+
+    def _finish_part(self):
+        if self._writer is None:
+            return []
+        self._writer.close()
+        os.replace(self._tmp_path, self._tmp_path[:-len(".tmp")])
+        self._writer = None
+        scenes, self._scenes = self._scenes, []
+        return scenes
+
+    def write_error(self, path, error):
+        self._errors.write(json.dumps({"path": path, "error": error}) + "\n")
+        self._errors.flush()
+
+    def close(self):
+        self._errors.close()
+        return self._finish_part()
+
+
+# ==========================================
+# 4. DRIVER
+# ==========================================
+def run(paths, output, fmt="ndjson", checkpoint=None, workers=None, threads=None,
+        patch_size=64, batch_size=64, model_path=None, backend="eager", log=print,
+        scenes_per_part=16):
+    """
+    Classifies `paths` on a process pool and streams results to `output`.
+    Scenes listed in `checkpoint` or already complete in `output` are
+    skipped; scenes are appended to the checkpoint once their output is
+    complete on disk (per line for NDJSON, per closed part for Parquet).
+    Returns the run summary (scenes, failures, patches, patches/sec).
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or cpus
+    threads = threads or max(1, cpus // workers)
+    checkpoint = checkpoint or f"{output.rstrip(os.sep)}.done"
+
+    writer = ParquetWriter(output, scenes_per_part) if fmt == "parquet" else NdjsonWriter(output)
+    # Output written just before a crash may have missed the checkpoint
+    done = read_checkpoint(checkpoint) | writer.finished()
+    todo = [path for path in paths if path not in done]
+    log(f"🗂️ {len(paths)} scenes, {len(paths) - len(todo)} already done, "
+        f"{workers} workers x {threads} threads")
+
+    summary = {"scenes": 0, "failed": 0, "patches": 0, "skipped": len(paths) - len(todo)}
+    started = time.perf_counter()
+
+    # spawn: workers must not inherit the parent's torch thread pools
+    context = multiprocessing.get_context("spawn")
+    done_file = open(checkpoint, "a")
+
+    def mark_done(scenes):
+        for path in scenes:
+            done_file.write(path + "\n")
+        done_file.flush()
+
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context,
+            initializer=_init_worker, initargs=(model_path, backend, threads, batch_size)
+        ) as pool:
+            futures = [pool.submit(_classify_scene, path, patch_size) for path in todo]
+            for future in as_completed(futures):
+                result = future.result()
+                if "error" in result:
+                    summary["failed"] += 1
+                    writer.write_error(result["path"], result["error"])
+                    log(f"⚠️ {result['path']}: {result['error']}")
+                    continue
+
+                mark_done(writer.write(result))
+
+                summary["scenes"] += 1
+                summary["patches"] += result["label_grid"].size
+                elapsed = time.perf_counter() - started
+                log(f"✅ [{summary['scenes'] + summary['failed']}/{len(todo)}] {os.path.basename(result['path'])} "
+                    f"{result['label_grid'].size} patches in {result['seconds']:.1f}s | "
+                    f"{summary['patches'] / elapsed:.1f} patches/s overall")
+    finally:
+        mark_done(writer.close())
+        done_file.close()
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed_s"] = round(elapsed, 2)
+    summary["patches_per_sec"] = round(summary["patches"] / elapsed, 1) if elapsed > 0 else None
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk land-cover classification of scene files")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="directory to walk for scenes")
+    source.add_argument("--manifest", help="file listing scene paths (plain or JSONL with \"path\")")
+    parser.add_argument("--output", required=True, help="NDJSON file, or directory for parquet")
+    parser.add_argument("--format", default="ndjson", choices=["ndjson", "parquet"])
+    parser.add_argument("--checkpoint", default=None, help="completed-scenes file (default: <output>.done)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--patch-size", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--model", default=None, help="checkpoint path (default: core/isro_model.pth)")
+    parser.add_argument("--backend", default="eager", help="inference backend (see core/backends.py)")
+    parser.add_argument("--scenes-per-part", type=int, default=16,
+                        help="parquet: scenes per part file, the most a crash can lose")
+    args = parser.parse_args(argv)
+
+    paths = find_scenes(args.input, args.manifest)
+    summary = run(
+        paths, args.output, args.format, args.checkpoint, args.workers, args.threads,
+        args.patch_size, args.batch_size, args.model, args.backend,
+        log=lambda message: print(message, file=sys.stderr), scenes_per_part=args.scenes_per_part
+    )
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of per-patch predictions.
+    Keys are digests of the decoded pixels plus everything else that can
+    change the answer (model version, patch shape, heuristic thresholds).
+    The in-memory tier is an LRU bounded by `max_entries`; when `disk_dir`
+    is set, entries are also written there as small JSON files and read
+    back on a memory miss.
+    """
+
+    def __init__(self, max_entries=50000, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(pixels, context):
+        """Digest of a uint8 pixel array and a context string (model/heuristic config)."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(context.encode())
+        h.update(str(pixels.shape).encode())
+        h.update(pixels.tobytes())
+        return h.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached (label, confidence, probabilities) or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if value is None and self.disk_dir:
+            try:
+                with open(self._disk_path(key)) as f:
+                    value = tuple(json.load(f))
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        label, conf, probs = value
+        # Callers may mutate the probability dict, hand out a copy
+        return label, conf, dict(probs)
+
+    def put(self, key, value):
+        label, conf, probs = value
+        value = (label, conf, dict(probs))
+        self._remember(key, value)
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: Could not write prediction cache entry: {e}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_dir": self.disk_dir,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            }
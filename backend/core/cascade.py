@@ -0,0 +1,135 @@
+import numpy as np
+import torch
+import torch.nn as nn
+from torchvision import models
+
+# Cheap first-stage classifiers, see load_cascade()
+CASCADES = ("histogram", "mobilenet")
+
+# Histogram features: 8 bins per channel
+_BINS = 8
+
+
+class HistogramCascade:
+    """
+    Tiny colour/texture classifier: per-channel means, standard deviations and
+    8-bin histograms plus mean gradient magnitude, fed to a softmax regression.
+    Costs a few array ops per batch, no model forward.
+    Stored as .npz (weights, bias, feature mean/std, class_names), see fit().
+    """
+
+    kind = "histogram"
+
+    def __init__(self, path):
+        data = np.load(path, allow_pickle=False)
+        self.weights = data["weights"]
+        self.bias = data["bias"]
+        self.feature_mean = data["feature_mean"]
+        self.feature_std = data["feature_std"]
+        self.class_names = [str(name) for name in data["class_names"]]
+
+    @staticmethod
+    def features(blocks):
+        """(N, h, w, 3) uint8 -> (N, 3 + 3 + 24 + 1) float32 features."""
+        blocks = np.asarray(blocks)
+        n = len(blocks)
+        pixels = blocks.reshape(n, -1, 3)
+        values = pixels.astype(np.float32)
+
+        means = values.mean(axis=1) / 255
+        stds = values.std(axis=1) / 255
+
+        # Per-channel histograms via one bincount over (patch, channel, bin) ids
+        bins = (pixels >> 5).astype(np.int64)
+        ids = (np.arange(n)[:, None, None] * 3 + np.arange(3)[None, None, :]) * _BINS + bins
+        hist = np.bincount(ids.ravel(), minlength=n * 3 * _BINS).reshape(n, 3 * _BINS)
+        hist = hist.astype(np.float32) / pixels.shape[1]
+
+        gray = values.reshape(blocks.shape).mean(axis=-1)
+        gradient = (np.abs(np.diff(gray, axis=1)).mean(axis=(1, 2))
+                    + np.abs(np.diff(gray, axis=2)).mean(axis=(1, 2))) / 255
+
+        return np.concatenate([means, stds, hist, gradient[:, None]], axis=1)
+
+    def predict_proba(self, blocks):
+        """Class probabilities (N, C) for a sequence of uint8 (h, w, 3) patches of any sizes."""
+        if isinstance(blocks, np.ndarray):
+            return self._predict_same_shape(blocks)
+        groups = {}
+        for i, block in enumerate(blocks):
+            groups.setdefault(block.shape, []).append(i)
+        probs = np.empty((len(blocks), len(self.class_names)), np.float32)
+        for idxs in groups.values():
+            probs[idxs] = self._predict_same_shape(np.stack([blocks[i] for i in idxs]))
+        return probs
+
+    def _predict_same_shape(self, blocks):
+        x = (self.features(blocks) - self.feature_mean) / self.feature_std
+        logits = x @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def fit(cls, blocks, labels, class_names, path, epochs=500, lr=0.1, weight_decay=1e-4):
+        """
+        Fits the softmax regression on patches and integer labels (e.g. the
+        big model's own predictions, see ai_engine.fit_cascade) and saves it.
+        Returns the training accuracy.
+        """
+        features = cls.features(blocks)
+        feature_mean = features.mean(axis=0)
+        feature_std = features.std(axis=0) + 1e-6
+        x = torch.from_numpy((features - feature_mean) / feature_std)
+        y = torch.as_tensor(labels, dtype=torch.long)
+
+        linear = nn.Linear(x.shape[1], len(class_names))
+        optimizer = torch.optim.Adam(linear.parameters(), lr=lr, weight_decay=weight_decay)
+        for _ in range(epochs):
+            optimizer.zero_grad()
+            loss = nn.functional.cross_entropy(linear(x), y)
+            loss.backward()
+            optimizer.step()
+
+        with torch.no_grad():
+            accuracy = (linear(x).argmax(dim=1) == y).float().mean().item()
+        np.savez(
+            path,
+            weights=linear.weight.detach().numpy().T.astype(np.float32),
+            bias=linear.bias.detach().numpy().astype(np.float32),
+            feature_mean=feature_mean.astype(np.float32),
+            feature_std=feature_std.astype(np.float32),
+            class_names=np.array(class_names)
+        )
+        return accuracy
+
+
+class MobileNetCascade:
+    """
+    MobileNetV2 fine-tuned on the same classes, saved in the isro_model.pth
+    layout ({"class_names", "model_state_dict"}). Shares the engine's
+    preprocessing; roughly 1/13 of ResNet50's FLOPs per patch.
+    """
+
+    kind = "mobilenet"
+
+    def __init__(self, path, preprocess, device):
+        checkpoint = torch.load(path, map_location=device)
+        self.class_names = list(checkpoint["class_names"])
+        model = models.mobilenet_v2(num_classes=len(self.class_names))
+        model.load_state_dict(checkpoint["model_state_dict"])
+        self.model = model.to(device).eval()
+        self._preprocess = preprocess
+
+    def predict_proba(self, blocks):
+        with torch.no_grad():
+            logits = self.model(self._preprocess(blocks))
+            return torch.softmax(logits, dim=1).cpu().numpy()
+
+
+def load_cascade(kind, path, preprocess=None, device="cpu"):
+    if kind not in CASCADES:
+        raise ValueError(f"Unknown cascade: {kind} (expected one of {', '.join(CASCADES)})")
+    if kind == "histogram":
+        return HistogramCascade(path)
+    return MobileNetCascade(path, preprocess, device)
@@ -0,0 +1,177 @@
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+# Master switch: when False every record call returns immediately
+ENABLED = True
+
+# Latency buckets (seconds) shared by all stage / wait histograms
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Per-request stage totals for the Server-Timing header; None outside a timed request
+request_timings = ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label value, Prometheus style."""
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_value, value):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series.setdefault(label_value, [[0] * len(self.buckets), 0, 0.0])
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        series[1] += 1
+        series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_value, (counts, count, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._values = {}
+
+    def inc(self, label_value, amount=1):
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_value, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = None
+
+    def render(self):
+        if self.value is None:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.value}"]
+
+
+_lock = Lock()
+stage_seconds = Histogram(
+    "vega_stage_seconds", "Time spent per pipeline stage.", "stage", TIME_BUCKETS)
+queue_wait_seconds = Histogram(
+    "vega_queue_wait_seconds", "Time work waited before it started running.", "queue", TIME_BUCKETS)
+batch_size = Histogram(
+    "vega_batch_size", "Items per batch (model forward passes and /predict micro-batches).", "batch", SIZE_BUCKETS)
+patches_total = Counter(
+    "vega_patches_total", "Patches classified, by which layer answered.", "source")
+model_load_seconds = Gauge("vega_model_load_seconds", "Time taken to load the model.")
+model_warmup_seconds = Gauge("vega_model_warmup_seconds", "Time taken by the warm-up forward pass.")
+
+_REGISTRY = (stage_seconds, queue_wait_seconds, batch_size, patches_total, model_load_seconds, model_warmup_seconds)
+
+
+def observe_stage(stage, seconds):
+    """Records `seconds` spent in `stage`, and adds it to the current request's Server-Timing."""
+    if not ENABLED:
+        return
+    with _lock:
+        stage_seconds.observe(stage, seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def observe_wait(queue, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        queue_wait_seconds.observe(queue, seconds)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[f"{queue}_wait"] = timings.get(f"{queue}_wait", 0.0) + seconds
+
+
+def observe_batch(kind, size):
+    if not ENABLED:
+        return
+    with _lock:
+        batch_size.observe(kind, size)
+
+
+def count_patches(source, amount):
+    if not ENABLED or not amount:
+        return
+    with _lock:
+        patches_total.inc(source, amount)
+
+
+def set_gauge(gauge, value):
+    if ENABLED:
+        gauge.value = value
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """`with metrics.stage("forward"): ...` times the block (a shared no-op when disabled)."""
+    return _Stage(name) if ENABLED else _NO_STAGE
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        lines = []
+        for metric in _REGISTRY:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def server_timing(timings):
+    """Stage totals (seconds) -> Server-Timing header value, e.g. 'forward;dur=12.3'."""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
@@ -0,0 +1,166 @@
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+
+_IMAGE_ID = re.compile(r"[0-9a-f]{8,64}")
+
+
+class GridPyramid:
+    """
+    Multi-resolution label grid built once from the finest analysis grid.
+    Level 0 is the finest grid (cells of `patch_size` pixels); every level
+    above merges 2x2 cells: majority class over all finest cells underneath
+    and mean of their confidences. Levels are addressed XYZ-style by zoom
+    `z`: z = 0 is the coarsest (a single cell), z = max_zoom the finest.
+    """
+
+    def __init__(self, levels, patch_size, classes, image_size, tile_size=16):
+        self.levels = levels
+        self.patch_size = patch_size
+        self.classes = list(classes)
+        self.image_width, self.image_height = image_size
+        self.tile_size = tile_size
+
+    @classmethod
+    def build(cls, label_grid, confidence_grid, patch_size, classes, image_size, tile_size=16):
+        """
+        Aggregates (rows, cols) label / confidence arrays into all coarser levels.
+        Class counts and confidence sums are additive, so each level is summed
+        from the one below and still equals the majority over the finest cells.
+        """
+        n_classes = len(classes)
+        counts = np.eye(n_classes, dtype=np.int32)[label_grid]
+        conf_sum = confidence_grid.astype(np.float64)
+        cells = np.ones(label_grid.shape, np.int32)
+
+        levels = [(label_grid.astype(np.uint8), confidence_grid.astype(np.float32))]
+        while counts.shape[0] > 1 or counts.shape[1] > 1:
+            counts, conf_sum, cells = (_merge_2x2(a) for a in (counts, conf_sum, cells))
+            # argmax picks the lowest class index on ties, so levels are deterministic
+            labels = counts.argmax(axis=-1).astype(np.uint8)
+            conf = np.round(conf_sum / np.maximum(cells, 1), 2).astype(np.float32)
+            levels.append((labels, conf))
+
+        return cls(levels, patch_size, classes, image_size, tile_size)
+
+    @property
+    def max_zoom(self):
+        return len(self.levels) - 1
+
+    def level(self, z):
+        if not 0 <= z <= self.max_zoom:
+            raise ValueError(f"Zoom must be between 0 and {self.max_zoom}")
+        labels, conf = self.levels[self.max_zoom - z]
+        return labels, conf, self.patch_size << (self.max_zoom - z)
+
+    def describe(self):
+        levels = []
+        for z in range(self.max_zoom + 1):
+            labels, _, cell_size = self.level(z)
+            rows, cols = labels.shape
+            levels.append({
+                "z": z, "cell_size": cell_size, "rows": rows, "cols": cols,
+                "tiles_x": -(-cols // self.tile_size), "tiles_y": -(-rows // self.tile_size),
+            })
+        return levels
+
+    def tile(self, z, x, y):
+        """Cells of XYZ tile (z, x, y): up to tile_size x tile_size cells. Returns (labels, conf, cell_size, row0, col0)."""
+        labels, conf, cell_size = self.level(z)
+        row0, col0 = y * self.tile_size, x * self.tile_size
+        if x < 0 or y < 0 or row0 >= labels.shape[0] or col0 >= labels.shape[1]:
+            raise ValueError(f"Tile {z}/{x}/{y} is outside the image")
+        rows = slice(row0, row0 + self.tile_size)
+        cols = slice(col0, col0 + self.tile_size)
+        return labels[rows, cols], conf[rows, cols], cell_size, row0, col0
+
+    def window(self, z, x0, y0, x1, y1):
+        """Cells of level z overlapping the pixel box [x0, x1) x [y0, y1). Returns (labels, conf, cell_size, row0, col0)."""
+        labels, conf, cell_size = self.level(z)
+        col0, row0 = max(0, x0 // cell_size), max(0, y0 // cell_size)
+        col1, row1 = -(-x1 // cell_size), -(-y1 // cell_size)
+        return labels[row0:row1, col0:col1], conf[row0:row1, col0:col1], cell_size, row0, col0
+
+    def save(self, path):
+        arrays = {}
+        for i, (labels, conf) in enumerate(self.levels):
+            arrays[f"labels_{i}"] = labels
+            arrays[f"conf_{i}"] = conf
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path, classes=np.array(self.classes),
+            meta=np.array([self.patch_size, self.image_width, self.image_height, self.tile_size, len(self.levels)]),
+            **arrays
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            patch_size, width, height, tile_size, n_levels = (int(v) for v in data["meta"])
+            levels = [(data[f"labels_{i}"], data[f"conf_{i}"]) for i in range(n_levels)]
+            classes = [str(c) for c in data["classes"]]
+        return cls(levels, patch_size, classes, (width, height), tile_size)
+
+
+def _merge_2x2(arr):
+    """Sums 2x2 cell blocks of a (rows, cols, ...) array, zero-padding odd edges."""
+    rows, cols = arr.shape[:2]
+    pad = [(0, rows % 2), (0, cols % 2)] + [(0, 0)] * (arr.ndim - 2)
+    if rows % 2 or cols % 2:
+        arr = np.pad(arr, pad)
+    rows, cols = arr.shape[:2]
+    return arr.reshape(rows // 2, 2, cols // 2, 2, *arr.shape[2:]).sum(axis=(1, 3))
+
+
+class PyramidStore:
+    """
+    Pyramids by image id (content hash): an in-memory LRU of `max_images`,
+    optionally backed by .npz files in `disk_dir` that survive restarts.
+    """
+
+    def __init__(self, max_images=32, disk_dir=None):
+        self.max_images = max_images
+        self.disk_dir = disk_dir
+        self._pyramids = OrderedDict()
+        self._lock = Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, image_id):
+        return os.path.join(self.disk_dir, f"{image_id}.npz")
+
+    def get(self, image_id):
+        if not _IMAGE_ID.fullmatch(image_id):
+            return None
+        with self._lock:
+            pyramid = self._pyramids.get(image_id)
+            if pyramid is not None:
+                self._pyramids.move_to_end(image_id)
+                return pyramid
+
+        if self.disk_dir and os.path.exists(self._disk_path(image_id)):
+            try:
+                pyramid = GridPyramid.load(self._disk_path(image_id))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Could not read pyramid {image_id}: {e}")
+                return None
+            self._remember(image_id, pyramid)
+        return pyramid
+
+    def put(self, image_id, pyramid):
+        self._remember(image_id, pyramid)
+        if self.disk_dir:
+            try:
+                pyramid.save(self._disk_path(image_id))
+            except OSError as e:
+                print(f"Warning: Could not write pyramid {image_id}: {e}")
+
+    def _remember(self, image_id, pyramid):
+        with self._lock:
+            self._pyramids[image_id] = pyramid
+            self._pyramids.move_to_end(image_id)
+            while len(self._pyramids) > self.max_images:
+                self._pyramids.popitem(last=False)
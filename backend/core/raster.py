@@ -0,0 +1,258 @@
+import io
+import struct
+from threading import Lock
+import numpy as np
+from PIL import Image, ImageFile
+
+# Bytes per pixel of the raw (uncompressed) layouts we can window into
+_RAW_BYTES_PER_PIXEL = {"RGB": 3, "RGBX": 4, "RGBA": 4, "L": 1}
+
+# TIFF tags a strip/tile needs to decode on its own, with their field types
+# (3 = SHORT, 7 = UNDEFINED); copied into the one-window TIFFs TiffStripRaster builds
+_TIFF_DECODE_TAGS = {
+    258: 3,  # BitsPerSample
+    259: 3,  # Compression
+    262: 3,  # PhotometricInterpretation
+    277: 3,  # SamplesPerPixel
+    284: 3,  # PlanarConfiguration
+    317: 3,  # Predictor
+    338: 3,  # ExtraSamples
+    339: 3,  # SampleFormat
+    347: 7,  # JPEGTables
+    530: 3,  # YCbCrSubSampling
+}
+_TIFF_TYPE_FORMATS = {3: "H", 4: "I", 7: "B"}
+
+# Pillow's decompression-bomb limit, kept for everything that is not a scene
+DEFAULT_MAX_PIXELS = Image.MAX_IMAGE_PIXELS
+_pixel_limit_lock = Lock()
+
+
+def open_image(fp, max_pixels=DEFAULT_MAX_PIXELS):
+    """
+    Image.open (lazy, header only) with its own decompression-bomb limit.
+    Image.MAX_IMAGE_PIXELS is process-wide, so it is only swapped under a
+    lock and restored before returning; uploads opened through here never
+    see a scene's raised limit.
+    """
+    with _pixel_limit_lock:
+        previous = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = max_pixels
+        try:
+            return Image.open(fp)
+        finally:
+            Image.MAX_IMAGE_PIXELS = previous
+
+
+class ArrayRaster:
+    """
+    Windowed reads from an (H, W, 3) uint8 array.
+    Works the same for in-memory arrays, np.memmap and .npy files opened with
+    mmap_mode="r", where only the requested rows are paged in.
+    """
+
+    def __init__(self, arr):
+        self.arr = arr
+        self.height, self.width = arr.shape[:2]
+
+    def read_rows(self, y0, y1):
+        return np.asarray(self.arr[y0:min(y1, self.height)])
+
+
+class PILRaster:
+    """Windowed reads from an already decoded RGB PIL image (no full ndarray copy)."""
+
+    def __init__(self, img):
+        self.img = img
+        self.width, self.height = img.size
+
+    def read_rows(self, y0, y1):
+        return np.asarray(self.img.crop((0, y0, self.width, min(y1, self.height))))
+
+
+class RawTileRaster:
+    """
+    Windowed reads from uncompressed (raw) TIFF strips/tiles without decoding
+    the rest of the file: each read re-opens the image and trims PIL's tile
+    list to the requested rows, so memory is bounded by the window size.
+    Relies on Pillow internals (ImageFile._Tile, Image._size); if they are
+    missing or changed, reads fall back to a fully decoded PILRaster.
+    """
+
+    def __init__(self, opener):
+        self._opener = opener
+        self._fallback = None
+        img = opener()
+        self.width, self.height = img.size
+        img.close()
+
+    @staticmethod
+    def supports(img):
+        try:
+            if not img.tile:
+                return False
+            for tile in img.tile:
+                if tile.codec_name != "raw" or len(tile.args) < 3:
+                    return False
+                rawmode, stride, orientation = tile.args[:3]
+                bpp = _RAW_BYTES_PER_PIXEL.get(rawmode)
+                width = tile.extents[2] - tile.extents[0]
+                if bpp is None or orientation != 1 or stride not in (0, width * bpp):
+                    return False
+            return True
+        except (AttributeError, TypeError):
+            # Older Pillow: tiles are plain tuples without named fields
+            return False
+
+    def read_rows(self, y0, y1):
+        if self._fallback is None:
+            try:
+                return self._read_window(y0, y1)
+            except (AttributeError, TypeError):
+                img = self._opener()
+                self._fallback = PILRaster(img.convert("RGB"))
+                img.close()
+        return self._fallback.read_rows(y0, y1)
+
+    def _read_window(self, y0, y1):
+        y1 = min(y1, self.height)
+        img = self._opener()
+        try:
+            tiles = []
+            for tile in img.tile:
+                x0, ty0, x1, ty1 = tile.extents
+                top, bottom = max(y0, ty0), min(y1, ty1)
+                if top >= bottom:
+                    continue
+                row_bytes = (x1 - x0) * _RAW_BYTES_PER_PIXEL[tile.args[0]]
+                tiles.append(ImageFile._Tile(
+                    tile.codec_name,
+                    (x0, top - y0, x1, bottom - y0),
+                    tile.offset + (top - ty0) * row_bytes,
+                    tile.args
+                ))
+
+            # Shrink the image to the window; PIL then only decodes these tiles
+            img.tile = tiles
+            img._size = (self.width, y1 - y0)
+            if hasattr(img, "_tile_size"):
+                # TIFF allocates its canvas from _tile_size rather than size
+                img._tile_size = img._size
+            return np.asarray(img.convert("RGB"))
+        finally:
+            img.close()
+
+
+class TiffStripRaster:
+    """
+    Windowed reads from compressed (LZW, Deflate, JPEG, PackBits...) striped
+    or tiled TIFFs. Pillow hands those to libtiff as one whole-image tile, so
+    instead each read copies just the strips / tile rows covering the window
+    into a small single-IFD TIFF with the same compression tags and decodes
+    that: memory is bounded by the window plus one strip / tile row.
+    Reads fall back to a fully decoded PILRaster if a window cannot be decoded.
+    """
+
+    def __init__(self, opener, read_bytes):
+        self._opener = opener
+        self._read_bytes = read_bytes
+        self._fallback = None
+        img = opener()
+        try:
+            tags = img.tag_v2
+            self.width, self.height = img.size
+            self._tiled = 322 in tags
+            if self._tiled:
+                self._unit = (tags[322], tags[323])
+                self._offsets, self._counts = tags[324], tags[325]
+            else:
+                self._unit = (self.width, tags.get(278, self.height))
+                self._offsets, self._counts = tags[273], tags[279]
+            self._tags = {tag: tags[tag] for tag in _TIFF_DECODE_TAGS if tag in tags}
+        finally:
+            img.close()
+
+    @staticmethod
+    def supports(img):
+        """Single-page, chunky 8-bit TIFFs that libtiff decodes, with more than one strip / tile row."""
+        try:
+            if img.format != "TIFF" or len(img.tile) != 1 or img.tile[0].codec_name != "libtiff":
+                return False
+            tags = img.tag_v2
+            bits = tags.get(258, 8)
+            unit_height = tags[323] if 322 in tags else tags.get(278, img.size[1])
+            return (
+                tags.get(284, 1) == 1
+                and all(b == 8 for b in (bits if isinstance(bits, tuple) else (bits,)))
+                and tags.get(262) in (1, 2, 6)
+                and (273 in tags or 324 in tags)
+                and unit_height < img.size[1]
+            )
+        except (AttributeError, TypeError, KeyError):
+            return False
+
+    def read_rows(self, y0, y1):
+        if self._fallback is None:
+            try:
+                return self._read_window(y0, min(y1, self.height))
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                print(f"⚠️ Warning: Windowed TIFF read failed, decoding the whole scene. {e}")
+                img = self._opener()
+                self._fallback = PILRaster(img.convert("RGB"))
+                img.close()
+        return self._fallback.read_rows(y0, y1)
+
+    def _read_window(self, y0, y1):
+        unit_w, unit_h = self._unit
+        first, last = y0 // unit_h, -(-y1 // unit_h)
+        per_row = -(-self.width // unit_w) if self._tiled else 1
+        indices = range(first * per_row, min(last * per_row, len(self._offsets)))
+        chunks = [self._read_bytes(self._offsets[i], self._counts[i]) for i in indices]
+
+        top = first * unit_h
+        height = min(last * unit_h, self.height) - top
+        with Image.open(io.BytesIO(_tiff_window(self._tags, self.width, height, self._unit, self._tiled, chunks))) as img:
+            rows = np.asarray(img.convert("RGB"))
+        return rows[y0 - top:y1 - top]
+
+
+def _tiff_window(tags, width, height, unit, tiled, chunks):
+    """Little-endian TIFF bytes: one IFD with `tags` + the geometry, `chunks` as its strips / tiles."""
+    counts = tuple(len(chunk) for chunk in chunks)
+    entries = {256: (4, (width,)), 257: (4, (height,))}
+    for tag, value in tags.items():
+        values = tuple(value) if isinstance(value, (tuple, list, bytes)) else (value,)
+        entries[tag] = (_TIFF_DECODE_TAGS[tag], values)
+    if tiled:
+        entries.update({322: (4, (unit[0],)), 323: (4, (unit[1],)), 324: (4, counts), 325: (4, counts)})
+    else:
+        entries.update({278: (4, (unit[1],)), 273: (4, counts), 279: (4, counts)})
+
+    # Layout: header, IFD, out-of-line values, then the chunk data
+    ifd_size = 2 + 12 * len(entries) + 4
+    values_size = 0
+    for kind, values in entries.values():
+        size = struct.calcsize("<" + _TIFF_TYPE_FORMATS[kind] * len(values))
+        values_size += size + size % 2 if size > 4 else 0
+    offset = 8 + ifd_size + values_size
+    chunk_offsets = []
+    for count in counts:
+        chunk_offsets.append(offset)
+        offset += count
+    entries[324 if tiled else 273] = (4, tuple(chunk_offsets))
+
+    ifd = [struct.pack("<H", len(entries))]
+    extra = []
+    extra_offset = 8 + ifd_size
+    for tag in sorted(entries):
+        kind, values = entries[tag]
+        data = struct.pack("<" + _TIFF_TYPE_FORMATS[kind] * len(values), *values)
+        if len(data) <= 4:
+            ifd.append(struct.pack("<HHI", tag, kind, len(values)) + data.ljust(4, b"\0"))
+        else:
+            data += b"\0" * (len(data) % 2)
+            ifd.append(struct.pack("<HHII", tag, kind, len(values), extra_offset))
+            extra.append(data)
+            extra_offset += len(data)
+    ifd.append(struct.pack("<I", 0))
+    return b"".join([b"II*\0", struct.pack("<I", 8), *ifd, *extra, *chunks])
@@ -0,0 +1,385 @@
+import hashlib
+import os
+import random
+import threading
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision import models, transforms
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: runs are only serialized within one process
+    fcntl = None
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+
+# Same geometry as ai_engine._preprocess; normalization runs per batch on uint8 tensors
+_CROP = 224
+_decode_transform = transforms.Compose([transforms.Resize(256), transforms.CenterCrop(_CROP)])
+_MEAN = (torch.tensor([0.485, 0.456, 0.406]) * 255).view(1, 3, 1, 1)
+_STD = (torch.tensor([0.229, 0.224, 0.225]) * 255).view(1, 3, 1, 1)
+
+
+def find_samples(data_dir):
+    """
+    Labelled patches in ImageFolder layout (data_dir/<class name>/*.png).
+    Returns ([(path, class_index)], class_names), classes sorted by name.
+    """
+    if not os.path.isdir(data_dir):
+        raise FileNotFoundError(f"Training data not found at {data_dir} (expected {data_dir}/<class name>/*.png)")
+    class_names = sorted(
+        name for name in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, name))
+    )
+    samples = []
+    for label, name in enumerate(class_names):
+        for root, _, files in os.walk(os.path.join(data_dir, name)):
+            for file in sorted(files):
+                if file.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append((os.path.join(root, file), label))
+    if not samples:
+        raise FileNotFoundError(f"No labelled patches in {data_dir} (expected {data_dir}/<class name>/*.png)")
+    return samples, class_names
+
+
+def _samples_key(samples):
+    """Changes whenever a sample is added, removed, relabelled or rewritten."""
+    digest = hashlib.blake2b(digest_size=12)
+    for path, label in samples:
+        stat = os.stat(path)
+        digest.update(f"{path}:{label}:{stat.st_size}:{int(stat.st_mtime)}\n".encode())
+    return digest.hexdigest()
+
+
+def decode_patch(path):
+    """uint8 (224, 224, 3): Resize(256) + CenterCrop(224) of the RGB image, before normalization."""
+    with Image.open(path) as img:
+        return np.asarray(_decode_transform(img.convert("RGB")))
+
+
+class DecodedPatchCache:
+    """
+    Decoded, resized and cropped patches in a uint8 (N, 224, 224, 3) memmap
+    plus one "filled" flag per sample, keyed by the sample list. Loader
+    worker processes open the files themselves, so a patch decoded by any
+    worker in the first epoch is read back by all later epochs and runs.
+    """
+
+    def __init__(self, directory, samples):
+        os.makedirs(directory, exist_ok=True)
+        key = _samples_key(samples)
+        self.images_path = os.path.join(directory, f"patches-{key}.npy")
+        self.filled_path = os.path.join(directory, f"patches-{key}.filled.npy")
+        if not os.path.exists(self.filled_path):
+            # Created under temporary names and renamed: never opened half-written,
+            # and the flags file only appears once the images file is complete
+            _create_memmap(self.images_path, (len(samples), _CROP, _CROP, 3))
+            _create_memmap(self.filled_path, (len(samples),))
+        self._images = None
+        self._filled = None
+
+    def __getstate__(self):
+        # Memmaps are reopened in every worker process
+        return {**self.__dict__, "_images": None, "_filled": None}
+
+    def get(self, index, path):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode="r+")
+            self._filled = np.load(self.filled_path, mmap_mode="r+")
+        if self._filled[index]:
+            return np.array(self._images[index])
+        patch = decode_patch(path)
+        # Image before flag: a reader never sees a flagged but unwritten patch
+        self._images[index] = patch
+        self._filled[index] = 1
+        return patch
+
+
+def _create_memmap(path, shape):
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8, shape=shape).flush()
+    os.replace(tmp_path, path)
+
+
+class RunLock:
+    """
+    Non-blocking exclusive lock on `directory`/train.lock, held from acquire()
+    to release(). flock() locks are per open file, so the lock is exclusive
+    across prefork workers and threads alike, and the kernel drops it when a
+    holder dies. Without fcntl it falls back to a lock for this process.
+    """
+
+    _local = threading.Lock()
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "train.lock")
+        self._file = None
+
+    def acquire(self):
+        if fcntl is None:
+            return RunLock._local.acquire(blocking=False)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "a")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if fcntl is None:
+            RunLock._local.release()
+            return
+        # Closing the file drops the lock
+        self._file.close()
+        self._file = None
+
+
+class PatchDataset(Dataset):
+    """
+    (uint8 (3, 224, 224) tensor, label) for the samples at `indices`.
+    `augment` adds random flips and 90 degree rotations, which keep
+    land-cover labels valid.
+    """
+
+    def __init__(self, samples, indices, cache=None, augment=False):
+        self.samples = samples
+        self.indices = list(indices)
+        self.cache = cache
+        self.augment = augment
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        index = self.indices[i]
+        path, label = self.samples[index]
+        patch = self.cache.get(index, path) if self.cache is not None else decode_patch(path)
+        if self.augment:
+            patch = np.rot90(patch, k=random.randrange(4))
+            if random.random() < 0.5:
+                patch = patch[:, ::-1]
+        return torch.from_numpy(np.require(patch, requirements=["C", "W"])).permute(2, 0, 1), label
+
+
+def _normalize(batch):
+    return (batch.float() - _MEAN) / _STD
+
+
+def build_model(class_names, init_path=None):
+    """
+    ResNet50 with a class_names-sized fc, initialised from a checkpoint in
+    the isro_model.pth layout. The fc is reused only when the checkpoint
+    has the same classes in the same order.
+    """
+    model = models.resnet50()
+    model.fc = nn.Linear(model.fc.in_features, len(class_names))
+    if init_path and os.path.exists(init_path):
+        checkpoint = torch.load(init_path, map_location="cpu")
+        state = checkpoint["model_state_dict"]
+        if list(checkpoint.get("class_names") or []) != list(class_names):
+            state = {k: v for k, v in state.items() if not k.startswith("fc.")}
+        model.load_state_dict(state, strict=False)
+    return model
+
+
+def save_checkpoint(model, class_names, path):
+    """Writes {class_names, model_state_dict}, the format ai_engine._build_eager_model loads."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({"class_names": list(class_names), "model_state_dict": model.state_dict()}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _split(count, val_split, seed):
+    order = list(range(count))
+    random.Random(seed).shuffle(order)
+    n_val = int(count * val_split) if count > 1 else 0
+    return order[n_val:], order[:n_val]
+
+
+def _loader(dataset, batch_size, workers, shuffle):
+    workers = min(workers, os.cpu_count() or 1)
+    return DataLoader(
+        dataset, batch_size=batch_size, shuffle=shuffle, num_workers=workers,
+        persistent_workers=workers > 0,
+    )
+
+
+def _timed_batches(loader):
+    """Yields (batch, seconds spent waiting for the loader)."""
+    iterator = iter(loader)
+    while True:
+        started = time.perf_counter()
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            return
+        yield batch, time.perf_counter() - started
+
+
+def _extract_features(model, loader, should_stop):
+    """Pooled 2048-d backbone features of every batch. Returns (features, labels, stall seconds)."""
+    fc, model.fc = model.fc, nn.Identity()
+    features, labels, stall = [], [], 0.0
+    try:
+        model.eval()
+        with torch.no_grad():
+            for (x, y), waited in _timed_batches(loader):
+                stall += waited
+                features.append(model(_normalize(x)))
+                labels.append(y)
+                if should_stop():
+                    raise InterruptedError("Training stopped")
+    finally:
+        model.fc = fc
+    return torch.cat(features), torch.cat(labels), stall
+
+
+def _feature_cache(cache_dir, samples, init_path):
+    if not cache_dir:
+        return None
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(_samples_key(samples).encode())
+    if init_path and os.path.exists(init_path):
+        stat = os.stat(init_path)
+        digest.update(f"{init_path}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    return os.path.join(cache_dir, f"features-{digest.hexdigest()}.npz")
+
+
+def _evaluate(forward, batches, loss_fn):
+    """(mean loss, accuracy) of forward() over (x, y) batches, None when there are none."""
+    total, correct, loss_sum = 0, 0, 0.0
+    with torch.no_grad():
+        for x, y in batches:
+            logits = forward(x)
+            loss_sum += loss_fn(logits, y).item() * len(y)
+            correct += (logits.argmax(dim=1) == y).sum().item()
+            total += len(y)
+    if not total:
+        return None, None
+    return loss_sum / total, correct / total
+
+
+def train(data_dir, output_path, epochs=10, batch_size=32, lr=1e-3, freeze_backbone=True,
+          val_split=0.2, workers=2, cache_dir=None, init_path=None, seed=0, should_stop=None):
+    """
+    Fine-tunes ResNet50 on labelled patches in `data_dir` (see find_samples),
+    starting from `init_path` (e.g. the served isro_model.pth).
+
+    freeze_backbone=True runs the frozen backbone once over every patch,
+    caches the pooled features (cache_dir) and trains only the fc head on
+    them, so epochs cost a few matrix products. Otherwise the whole network
+    trains on augmented patches. Decoded patches are cached in `cache_dir`
+    (memmap shared by the `workers` loader processes) either way.
+
+    Generator of progress events (dicts with "event": "start", "features",
+    "epoch"); returns after the last epoch. The best epoch (validation
+    accuracy, training accuracy without a validation split) is checkpointed
+    to `output_path`. `should_stop()` is polled between batches.
+    """
+    should_stop = should_stop or (lambda: False)
+    torch.manual_seed(seed)
+    random.seed(seed)
+
+    samples, class_names = find_samples(data_dir)
+    train_idx, val_idx = _split(len(samples), val_split, seed)
+    cache = DecodedPatchCache(os.path.join(cache_dir, "patches"), samples) if cache_dir else None
+    model = build_model(class_names, init_path)
+    loss_fn = nn.CrossEntropyLoss()
+    yield {
+        "event": "start", "classes": class_names, "train_samples": len(train_idx),
+        "val_samples": len(val_idx), "freeze_backbone": freeze_backbone, "epochs": epochs,
+    }
+
+    if freeze_backbone:
+        features_path = _feature_cache(cache_dir, samples, init_path)
+        if features_path and os.path.exists(features_path):
+            with np.load(features_path) as data:
+                features, labels = torch.from_numpy(data["features"]), torch.from_numpy(data["labels"])
+            stall, extract_s, cached = 0.0, 0.0, True
+        else:
+            started = time.perf_counter()
+            everything = PatchDataset(samples, range(len(samples)), cache)
+            features, labels, stall = _extract_features(
+                model, _loader(everything, batch_size, workers, shuffle=False), should_stop
+            )
+            extract_s, cached = time.perf_counter() - started, False
+            if features_path:
+                tmp_path = f"{features_path}.{os.getpid()}.tmp.npz"
+                np.savez(tmp_path, features=features.numpy(), labels=labels.numpy())
+                os.replace(tmp_path, features_path)
+        yield {
+            "event": "features", "samples": len(samples), "cached": cached,
+            "seconds": round(extract_s, 2), "loader_stall_s": round(stall, 2),
+            "samples_per_sec": round(len(samples) / extract_s, 1) if extract_s else None,
+        }
+
+        head = model.fc
+        optimizer = torch.optim.Adam(head.parameters(), lr=lr)
+        train_x, train_y = features[train_idx], labels[train_idx]
+        val_batches = [(features[val_idx], labels[val_idx])] if val_idx else []
+    else:
+        optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+        train_loader = _loader(PatchDataset(samples, train_idx, cache, augment=True), batch_size, workers, shuffle=True)
+        val_loader = _loader(PatchDataset(samples, val_idx, cache), batch_size, workers, shuffle=False) if val_idx else None
+
+    best = None
+    for epoch in range(1, epochs + 1):
+        started = time.perf_counter()
+        stall, seen, correct, loss_sum = 0.0, 0, 0, 0.0
+
+        if freeze_backbone:
+            # Features are in memory: no loader, no stalls
+            order = torch.randperm(len(train_y))
+            batches = (((train_x[order[i:i + batch_size]], train_y[order[i:i + batch_size]]), 0.0)
+                       for i in range(0, len(order), batch_size))
+            step_model, forward = head, head
+        else:
+            batches = _timed_batches(train_loader)
+            step_model, forward = model, lambda x: model(_normalize(x))
+
+        step_model.train()
+        for (x, y), waited in batches:
+            stall += waited
+            optimizer.zero_grad()
+            logits = forward(x)
+            loss = loss_fn(logits, y)
+            loss.backward()
+            optimizer.step()
+            loss_sum += loss.item() * len(y)
+            correct += (logits.argmax(dim=1) == y).sum().item()
+            seen += len(y)
+            if should_stop():
+                raise InterruptedError("Training stopped")
+        train_s = time.perf_counter() - started
+
+        step_model.eval()
+        if not freeze_backbone:
+            val_batches = [batch for batch, _ in _timed_batches(val_loader)] if val_loader is not None else []
+        val_loss, val_acc = _evaluate(forward, val_batches, loss_fn)
+
+        train_loss, train_acc = loss_sum / max(seen, 1), correct / max(seen, 1)
+        score = val_acc if val_acc is not None else train_acc
+        improved = best is None or score > best
+        if improved:
+            best = score
+            save_checkpoint(model, class_names, output_path)
+
+        yield {
+            "event": "epoch", "epoch": epoch, "epochs": epochs,
+            "train_loss": round(train_loss, 4), "train_accuracy": round(train_acc, 4),
+            "val_loss": round(val_loss, 4) if val_loss is not None else None,
+            "val_accuracy": round(val_acc, 4) if val_acc is not None else None,
+            "samples_per_sec": round(seen / train_s, 1) if train_s else None,
+            "loader_stall_s": round(stall, 3),
+            "epoch_time_s": round(time.perf_counter() - started, 2),
+            "checkpoint_saved": improved,
+        }
@@ -0,0 +1,48 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+CLASS_NAMES = ["Agricultural Land", "Barren Land", "Forest", "Urban Area", "Water Body"]
+
+
+def synthetic_scene(width, height, seed=1):
+    """Noise scene with a shadow, a water and a vegetation block, so every engine layer is hit."""
+    rng = np.random.default_rng(seed)
+    arr = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    arr[:64, :64] = 10
+    arr[64:128, :64] = [20, 40, 200]
+    arr[128:192, 64:128] = [30, 160, 40]
+    arr[:100, 150:250] = [140, 120, 130]
+    return arr
+
+
+@pytest.fixture(scope="session")
+def checkpoint(tmp_path_factory):
+    """Seeded random ResNet50 in the isro_model.pth layout (the trained weights are not in the repo)."""
+    import torch
+    import torch.nn as nn
+    from torchvision import models
+
+    torch.manual_seed(0)
+    model = models.resnet50()
+    model.fc = nn.Linear(model.fc.in_features, len(CLASS_NAMES))
+    path = tmp_path_factory.mktemp("model") / "isro_model.pth"
+    torch.save({"class_names": CLASS_NAMES, "model_state_dict": model.state_dict()}, path)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def engine(checkpoint):
+    """core.ai_engine on the test checkpoint, eager backend, no cache or cascade in the way."""
+    from core import ai_engine
+
+    ai_engine.MODEL_PATH = checkpoint
+    ai_engine.configure_backend("eager")
+    ai_engine.configure_cascade(None)
+    ai_engine.configure_cache(enabled=False)
+    return ai_engine
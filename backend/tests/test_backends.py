@@ -0,0 +1,94 @@
+import pytest
+import torch
+import torch.nn as nn
+from PIL import Image
+from torchvision import models
+
+from conftest import CLASS_NAMES, synthetic_scene
+
+# Largest softmax probability difference vs eager and minimum top-1 agreement
+# per backend on the validation crops below (fp32 graphs should be exact,
+# int8 ones drift; int8_static measured a 0.07 delta on these crops)
+MAX_PROB_DELTA = {"torchscript": 1e-4, "onnx": 1e-4, "int8_dynamic": 0.01, "int8_static": 0.1}
+MIN_TOP1_AGREEMENT = {"torchscript": 1.0, "onnx": 1.0, "int8_dynamic": 1.0, "int8_static": 0.75}
+
+
+@pytest.fixture(scope="module")
+def validation_dir(tmp_path_factory):
+    """24 crops of a synthetic scene: calibration (seed 0), validation (seed 1), held out (seed 2)."""
+    directory = tmp_path_factory.mktemp("validation")
+    scene = synthetic_scene(768, 512, seed=3)
+    for i in range(24):
+        y, x = divmod(i, 6)
+        Image.fromarray(scene[y * 128:(y + 1) * 128, x * 128:(x + 1) * 128]).save(directory / f"{i:02d}.png")
+    return str(directory)
+
+
+@pytest.fixture(scope="module")
+def backend_engine(validation_dir):
+    from core import ai_engine
+
+    ai_engine.configure_backend("eager", validation_dir=validation_dir, validation_samples=16)
+    yield ai_engine
+    ai_engine.configure_backend("eager")
+
+
+@pytest.fixture(scope="module")
+def model(backend_engine):
+    """
+    Seeded random ResNet50 whose BatchNorm statistics are fitted to the
+    calibration crops: with default statistics the logits saturate and every
+    backend agrees trivially.
+    """
+    torch.manual_seed(0)
+    model = models.resnet50()
+    model.fc = nn.Linear(model.fc.in_features, len(CLASS_NAMES))
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            module.reset_running_stats()
+            module.momentum = None
+    model.train()
+    with torch.no_grad():
+        for batch in backend_engine._validation_batches(8, seed=0):
+            model(batch)
+    return model.eval()
+
+
+@pytest.mark.parametrize("name", ["torchscript", "int8_dynamic", "int8_static", "onnx"])
+def test_backend_predictions_match_eager(backend_engine, model, name):
+    from core.backends import build_backend, compare_backends
+
+    if name == "onnx":
+        pytest.importorskip("onnxruntime")
+    calibration = backend_engine._validation_batches(8, seed=0)
+    held_out = backend_engine._validation_batches(8, seed=2)
+
+    runner = build_backend(name, model, calibration[0][:1], calibration=calibration)
+    report = compare_backends(model, runner, held_out)
+
+    assert report["samples"] == 8
+    assert report["max_prob_delta"] <= MAX_PROB_DELTA[name]
+    assert report["top1_agreement"] >= MIN_TOP1_AGREEMENT[name]
+
+
+@pytest.mark.parametrize("name", ["int8_dynamic", "int8_static"])
+@pytest.mark.parametrize("directory", [None, "empty"])
+def test_int8_backends_need_validation_images(backend_engine, model, name, directory, tmp_path, monkeypatch):
+    # Synthetic patches would validate trivially: no real images, no int8
+    monkeypatch.setattr(backend_engine, "BACKEND_VALIDATION_DIR", directory and str(tmp_path))
+    runner, backend, report = backend_engine._build_runner(model, name)
+
+    assert (runner, backend) == (model, "eager")
+    assert report["backend"] == name
+    assert "BACKEND_VALIDATION_DIR" in report["error"]
+
+
+def test_backend_falls_back_below_min_agreement(backend_engine, model, monkeypatch):
+    # No backend can reach 101% agreement: the gate must fall back
+    monkeypatch.setattr(backend_engine, "BACKEND_MIN_AGREEMENT", 1.01)
+    runner, backend, report = backend_engine._build_runner(model, "int8_dynamic")
+
+    assert (runner, backend) == (model, "eager")
+    assert report["backend"] == "int8_dynamic"
+    assert 0 <= report["top1_agreement"] <= 1
+    assert report["samples"] == 8
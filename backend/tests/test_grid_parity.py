@@ -0,0 +1,34 @@
+import io
+import pytest
+from PIL import Image
+from conftest import synthetic_scene
+
+
+def _per_patch_grid(engine, path, patch_size):
+    """The original analyze_single_image: crop every cell (black beyond the edge) and predict it alone."""
+    img = Image.open(path).convert("RGB")
+    width, height = img.size
+    grid = []
+    for y in range(0, height, patch_size):
+        for x in range(0, width, patch_size):
+            buffered = io.BytesIO()
+            img.crop((x, y, x + patch_size, y + patch_size)).save(buffered, format="PNG")
+            prediction = engine.predict_patch(buffered.getvalue())
+            grid.append({"x": x, "y": y, "class": prediction["class"], "confidence": prediction["confidence"]})
+    return grid
+
+
+@pytest.mark.parametrize("patch_size, width, height", [
+    (64, 256, 192),
+    # Scene sizes that are not multiples of the patch size: partial edge cells
+    (64, 300, 230),
+    (50, 300, 230),
+])
+def test_batched_grid_matches_per_patch_predictions(engine, tmp_path, patch_size, width, height):
+    path = tmp_path / "scene.png"
+    Image.fromarray(synthetic_scene(width, height)).save(path)
+
+    result = engine.analyze_single_image(str(path), patch_size)
+
+    assert (result["image_width"], result["image_height"]) == (width, height)
+    assert result["grid"] == _per_patch_grid(engine, str(path), patch_size)
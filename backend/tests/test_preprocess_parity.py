@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from conftest import synthetic_scene
+
+# One 8-bit level after normalization in the narrowest channel (std 0.224):
+# 1 / (255 * 0.224) ~= 0.0175. Downsampled tiles may round one level apart
+# from PIL; 1e-6 absorbs float32 noise in the normalization itself
+ONE_LEVEL = 1 / (255 * 0.224)
+FLOAT_EPS = 1e-6
+
+
+def _max_delta(engine, blocks):
+    reference = torch.stack([engine._preprocess(Image.fromarray(b)) for b in blocks])
+    batched = engine._batched_preprocess(blocks).cpu()
+    assert batched.shape == reference.shape == (len(blocks), 3, 224, 224)
+    return (batched - reference).abs().max().item()
+
+
+def test_one_level_bound():
+    assert ONE_LEVEL == pytest.approx(0.0175, abs=1e-4)
+
+
+@pytest.mark.parametrize("size", [32, 50, 64, 128, 200, 224])
+def test_upsampled_tiles_match_exactly(engine, size):
+    from core.backends import synthetic_patches
+
+    delta = _max_delta(engine, list(synthetic_patches(8, size=size, seed=size)))
+    assert delta <= FLOAT_EPS
+
+
+@pytest.mark.parametrize("size", [300, 320, 400, 512, 1000])
+def test_downsampled_tiles_within_one_level(engine, size):
+    from core.backends import synthetic_patches
+
+    delta = _max_delta(engine, list(synthetic_patches(4, size=size, seed=size)))
+    assert delta <= ONE_LEVEL + FLOAT_EPS
+    assert delta <= engine.PREPROCESS_TOLERANCE
+
+
+def test_mixed_shapes_and_non_square_tiles(engine):
+    scene = synthetic_scene(600, 400)
+    blocks = [scene[:64, :64].copy(), scene[:300, :400].copy(), scene[:400, :300].copy(),
+              scene[:60, :90].copy(), scene[100:164, 100:164].copy()]
+    assert _max_delta(engine, blocks) <= ONE_LEVEL + FLOAT_EPS
+
+
+@pytest.mark.parametrize("size", [300, 320, 480])
+def test_white_noise_within_one_level(engine, size):
+    # High-frequency noise is the worst case for rounding after the antialiased
+    # downsample (torch's uint8 kernel put 320px noise two levels from PIL)
+    rng = np.random.default_rng(size)
+    blocks = [rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(2)]
+    assert _max_delta(engine, blocks) <= ONE_LEVEL + FLOAT_EPS
+
+
+def test_preprocess_parity_default_set(engine):
+    assert engine.preprocess_parity() <= min(ONE_LEVEL + FLOAT_EPS, engine.PREPROCESS_TOLERANCE)
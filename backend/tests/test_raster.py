@@ -0,0 +1,99 @@
+import io
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+
+from core.raster import PILRaster, RawTileRaster, TiffStripRaster, _tiff_window
+
+WINDOWS = [(0, 64), (60, 200), (333, 500), (640, 700)]
+
+
+@pytest.fixture(scope="module")
+def scene():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (700, 530, 3), dtype=np.uint8)
+
+
+def _deflate_tiled(scene, tile=64):
+    """Tiled Deflate TIFF bytes (Pillow only writes striped TIFFs)."""
+    height, width = scene.shape[:2]
+    chunks = []
+    for y in range(0, height, tile):
+        for x in range(0, width, tile):
+            padded = np.zeros((tile, tile, 3), np.uint8)
+            part = scene[y:y + tile, x:x + tile]
+            padded[:part.shape[0], :part.shape[1]] = part
+            chunks.append(zlib.compress(padded.tobytes()))
+    tags = {258: (8, 8, 8), 259: 8, 262: 2, 277: 3}
+    return _tiff_window(tags, width, height, (tile, tile), True, chunks)
+
+
+def _tiff_bytes(scene, **options):
+    buffer = io.BytesIO()
+    Image.fromarray(scene).save(buffer, "TIFF", **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("layout, raster_type", [
+    ({}, RawTileRaster),
+    ({"compression": "tiff_lzw"}, TiffStripRaster),
+    ({"compression": "tiff_lzw", "tiffinfo": {317: 2, 278: 16}}, TiffStripRaster),
+    ({"compression": "tiff_adobe_deflate"}, TiffStripRaster),
+    ({"compression": "packbits"}, TiffStripRaster),
+    ("tiled", TiffStripRaster),
+])
+@pytest.mark.parametrize("source", ["path", "bytes", "file"])
+def test_tiff_windows_match_full_decode(engine, scene, tmp_path, layout, raster_type, source):
+    data = _deflate_tiled(scene) if layout == "tiled" else _tiff_bytes(scene, **layout)
+    if source == "path":
+        (tmp_path / "scene.tif").write_bytes(data)
+        image_input = str(tmp_path / "scene.tif")
+    else:
+        image_input = data if source == "bytes" else io.BytesIO(data)
+
+    raster, size, scale = engine.open_scene(image_input, 64)
+
+    assert isinstance(raster, raster_type)
+    assert size == (530, 700) and scale == 1
+    for y0, y1 in WINDOWS:
+        np.testing.assert_array_equal(raster.read_rows(y0, y1), scene[y0:y1])
+    assert raster._fallback is None
+
+
+def test_jpeg_tiff_windows_match_libtiff(engine, scene):
+    data = _tiff_bytes(scene, compression="jpeg")
+    full = np.asarray(Image.open(io.BytesIO(data)).convert("RGB"))
+
+    raster, _, _ = engine.open_scene(data, 64)
+
+    assert isinstance(raster, TiffStripRaster)
+    for y0, y1 in WINDOWS:
+        np.testing.assert_array_equal(raster.read_rows(y0, y1), full[y0:y1])
+
+
+def test_single_strip_tiff_is_decoded_once(engine, scene):
+    data = _tiff_bytes(scene, compression="tiff_lzw", tiffinfo={278: 700})
+
+    raster, _, _ = engine.open_scene(data, 64)
+
+    assert isinstance(raster, PILRaster)
+
+
+def test_undecodable_window_falls_back_to_full_decode(engine, scene):
+    data = bytearray(_tiff_bytes(scene, compression="tiff_adobe_deflate"))
+    raster, _, _ = engine.open_scene(bytes(data), 64)
+    # Corrupt the strip bytes the raster reads, not the file PIL falls back to
+    raster._read_bytes = lambda offset, length: b"\0" * length
+
+    np.testing.assert_array_equal(raster.read_rows(0, 64), scene[:64])
+    assert isinstance(raster._fallback, PILRaster)
+
+
+def test_uploads_keep_the_decompression_bomb_limit(engine):
+    buffer = io.BytesIO()
+    Image.new("L", (14000, 14000)).save(buffer, "PNG")
+
+    with pytest.raises(Image.DecompressionBombError):
+        engine._load_rgb_image(buffer.getvalue())
+    assert engine._open_image(buffer.getvalue(), engine.MAX_SCENE_PIXELS).size == (14000, 14000)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from conftest import synthetic_scene
+
+
+def _sliding(engine, monkeypatch, scene, patch_size, stride, shared):
+    monkeypatch.setattr(engine, "SHARED_WINDOW_FEATURES", shared)
+    return engine.analyze_scene_arrays(scene, patch_size, stride=stride)
+
+
+@pytest.mark.parametrize("stride, width, height", [(32, 300, 230), (16, 128, 128)])
+def test_shared_features_match_per_window_forwards(engine, monkeypatch, stride, width, height):
+    scene = synthetic_scene(width, height)
+
+    exact = _sliding(engine, monkeypatch, scene, 64, stride, False)
+    shared = _sliding(engine, monkeypatch, scene, 64, stride, True)
+
+    # Only the context at window borders differs (neighbours instead of zero padding)
+    assert shared["label_grid"].shape == exact["label_grid"].shape
+    assert (shared["label_grid"] == exact["label_grid"]).mean() >= 0.9
+    assert np.abs(shared["confidence_grid"] - exact["confidence_grid"]).mean() <= 5
+
+
+def test_off_grid_strides_use_per_window_forwards(engine, monkeypatch):
+    # stride 20 on patch 60 is not a multiple of the trunk's 32px feature step
+    def unexpected(*args):
+        raise AssertionError("shared features used off the feature grid")
+
+    monkeypatch.setattr(engine, "_shared_window_probs", unexpected)
+    result = _sliding(engine, monkeypatch, synthetic_scene(200, 140), 60, 20, True)
+
+    assert result["label_grid"].shape == (7, 10)
@@ -19,17 +19,28 @@ export interface PredictionResult {
     breakdown: Record<string, number>;
 }
 
+/** Per-file entry inside a predict-batch response (`error` set if the file failed to decode) */
+export interface BatchFileResult {
+    filename: string;
+    prediction?: string;
+    confidence?: number;
+    breakdown?: Record<string, number>;
+    error?: string;
+}
+
 /**
  * Matches the JSON shape returned by POST /classification/predict-batch
- * { message, stats: { total_processed, distribution: { "Urban": 2, ... } } }
+ * { message, stats: { total_processed, failed, distribution: { "Urban": 2, ... } }, results[] }
  */
 export interface BatchPredictionResult {
     message: string;
     stats: {
         total_processed: number;
+        failed: number;
         /** Class name → count of images predicted as that class */
         distribution: Record<string, number>;
     };
+    results: BatchFileResult[];
 }
 
 // ── Single predict ─────────────────────────────────────────────────────────────
@@ -189,3 +200,191 @@ export async function analyzeMap(
 
     return res.json() as Promise<MapAnalysisResult>;
 }
+
+
+/** One NDJSON frame from POST /classification/analyze-map/stream */
+export type MapStreamFrame =
+    | { type: 'meta'; filename: string; image_width: number; image_height: number; patch_size: number; total_patches: number }
+    | { type: 'cells'; cells: GridPatch[] }
+    | { type: 'progress'; processed: number; total_patches: number; elapsed_s: number; patches_per_sec: number | null }
+    | { type: 'complete'; processed: number; elapsed_s: number; patches_per_sec: number | null }
+    | { type: 'error'; detail: string };
+
+/**
+ * Streaming variant of analyzeMap: calls `onFrame` for every NDJSON frame as
+ * soon as the backend finishes an inference batch, so the overlay can be
+ * painted incrementally. Resolves with the assembled MapAnalysisResult.
+ */
+export async function analyzeMapStream(
+    file: File,
+    onFrame: (frame: MapStreamFrame) => void,
+    patchSize = 64,
+): Promise<MapAnalysisResult> {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    const res = await fetch(
+        `${API_BASE}/classification/analyze-map/stream?patch_size=${patchSize}`,
+        { method: 'POST', body: formData },
+    );
+
+    if (!res.ok || !res.body) {
+        let detail = `Server error ${res.status}`;
+        try {
+            const json = await res.json();
+            if (json?.detail) detail = json.detail;
+        } catch { /* ignore */ }
+        throw new Error(detail);
+    }
+
+    const result: MapAnalysisResult = {
+        filename: file.name,
+        image_width: 0,
+        image_height: 0,
+        patch_size: patchSize,
+        grid: [],
+    };
+
+    const handle = (line: string) => {
+        if (!line.trim()) return;
+        const frame = JSON.parse(line) as MapStreamFrame;
+        if (frame.type === 'meta') {
+            result.filename = frame.filename;
+            result.image_width = frame.image_width;
+            result.image_height = frame.image_height;
+            result.patch_size = frame.patch_size;
+        } else if (frame.type === 'cells') {
+            result.grid.push(...frame.cells);
+        } else if (frame.type === 'error') {
+            throw new Error(frame.detail);
+        }
+        onFrame(frame);
+    };
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() ?? '';
+        lines.forEach(handle);
+    }
+    handle(buffer);
+
+    return result;
+}
+
+// ─── Zoom Pyramid ─────────────────────────────────────────────────────────────
+
+export interface PyramidLevel {
+    z: number;
+    cell_size: number; // pixels per cell at this zoom
+    rows: number;
+    cols: number;
+    tiles_x: number;
+    tiles_y: number;
+}
+
+/** Response from POST /classification/pyramid and GET /classification/pyramid/{id} */
+export interface PyramidInfo {
+    image_id: string;
+    filename?: string;
+    cached?: boolean;
+    image_width: number;
+    image_height: number;
+    patch_size: number;
+    tile_size: number; // tile edge in cells
+    max_zoom: number;  // finest level; z = 0 is a single cell
+    classes: string[];
+    levels: PyramidLevel[];
+}
+
+async function requestJson<T>(url: string, init?: RequestInit): Promise<T> {
+    const res = await fetch(url, init);
+    if (!res.ok) {
+        let detail = `Server error ${res.status}`;
+        try {
+            const json = await res.json();
+            if (json?.detail) detail = json.detail;
+        } catch { /* ignore */ }
+        throw new Error(detail);
+    }
+    return res.json() as Promise<T>;
+}
+
+/**
+ * Analyzes the image once at `patchSize` and builds every coarser zoom level.
+ * Re-uploading the same image returns the stored pyramid immediately.
+ */
+export async function createPyramid(file: File, patchSize = 64): Promise<PyramidInfo> {
+    const formData = new FormData();
+    formData.append('file', file);
+    return requestJson<PyramidInfo>(
+        `${API_BASE}/classification/pyramid?patch_size=${patchSize}`,
+        { method: 'POST', body: formData },
+    );
+}
+
+/** Cells of zoom `z` covering a viewport (image pixels), shaped like analyzeMap's result. */
+export async function getPyramidWindow(
+    imageId: string,
+    z: number,
+    viewport: { x0: number; y0: number; x1: number; y1: number },
+): Promise<MapAnalysisResult & { z: number; image_id: string }> {
+    const { x0, y0, x1, y1 } = viewport;
+    return requestJson(
+        `${API_BASE}/classification/pyramid/${imageId}/window?z=${z}&x0=${x0}&y0=${y0}&x1=${x1}&y1=${y1}`,
+    );
+}
+
+/** URL of an XYZ tile: JSON cells, or a palette PNG (one pixel per cell) for image layers. */
+export function pyramidTileUrl(imageId: string, z: number, x: number, y: number, format: 'json' | 'png' = 'png'): string {
+    return `${API_BASE}/classification/pyramid/${imageId}/${z}/${x}/${y}?format=${format}`;
+}
+
+// ─── Background Jobs ──────────────────────────────────────────────────────────
+
+export interface AnalysisJob {
+    job_id: string;
+    kind: string;
+    filename: string;
+    patch_size: number;
+    status: 'queued' | 'running' | 'done' | 'failed';
+    progress: { processed: number; total: number | null; percent: number | null };
+    queue_position: number | null;
+    queue_wait_s: number;
+    run_time_s: number | null;
+    error: string | null;
+    result?: MapAnalysisResult;
+}
+
+/** Queues an analyze-map job; identical scenes already queued/done return the same job. */
+export async function submitAnalyzeMapJob(
+    file: File,
+    patchSize = 64,
+): Promise<{ job_id: string; deduplicated: boolean; status: AnalysisJob['status'] }> {
+    const formData = new FormData();
+    formData.append('file', file);
+    return requestJson(
+        `${API_BASE}/jobs/analyze-map?patch_size=${patchSize}`,
+        { method: 'POST', body: formData },
+    );
+}
+
+/** Polls a job until it is done (resolving with the map result) or failed (throwing). */
+export async function waitForJob(
+    jobId: string,
+    onProgress?: (job: AnalysisJob) => void,
+    intervalMs = 2000,
+): Promise<MapAnalysisResult> {
+    for (;;) {
+        const job = await requestJson<AnalysisJob>(`${API_BASE}/jobs/${jobId}`);
+        onProgress?.(job);
+        if (job.status === 'done' && job.result) return job.result;
+        if (job.status === 'failed') throw new Error(job.error ?? 'Job failed');
+        await new Promise((resolve) => setTimeout(resolve, intervalMs));
+    }
+}